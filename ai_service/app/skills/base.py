@@ -7,7 +7,7 @@ Provides the foundation for AI skills with specialized prompts and context handl
 from __future__ import annotations
 
 from abc import ABC, abstractmethod
-from typing import Any, Optional
+from typing import Any, ClassVar, Optional
 
 
 class BaseSkill(ABC):
@@ -30,6 +30,26 @@ class BaseSkill(ABC):
 - 引导：优先通过提问/分步提示促进学习，而非直接代写/代做
 - 输出：结构清晰，优先使用小标题与要点列表；需要结构化时输出 JSON（按指令）
 """
+
+    # Delimits the per-request context suffix from the invariant prompt prefix.
+    # Everything before it is byte-identical across calls for a given skill so
+    # provider-side prompt caches (longest-common-prefix match) can reuse it.
+    # With Anthropic, put ``cache_control={"type": "ephemeral"}`` on the first
+    # content block holding the prefix.
+    CONTEXT_SEPARATOR: ClassVar[str] = "\n<<<CONTEXT>>>\n"
+
+    # BASE_PROMPT + SKILL_PROMPT, concatenated once per class at definition time
+    PRECOMPILED_PROMPT: ClassVar[str] = BASE_PROMPT
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.PRECOMPILED_PROMPT = cls.BASE_PROMPT + getattr(cls, "SKILL_PROMPT", "")
+
+    def _with_context(self, prefix: str, parts: list[str]) -> str:
+        """Append context parts to the invariant prompt prefix in one join."""
+        if not parts:
+            return prefix
+        return "".join([prefix, self.CONTEXT_SEPARATOR, *parts])
     
     @abstractmethod
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
@@ -105,34 +125,34 @@ class SimQASkill(BaseSkill):
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for simulation Q&A."""
-        prompt = self.BASE_PROMPT + self.SKILL_PROMPT
+        parts: list[str] = []
         
         if context:
-            prompt += "\n【仿真上下文】\n"
+            parts.append("\n【仿真上下文】\n")
             if "sim_type" in context:
-                prompt += f"- 仿真类型：{context['sim_type']}\n"
+                parts.append(f"- 仿真类型：{context['sim_type']}\n")
             if "params" in context:
-                prompt += f"- 仿真参数：{context['params']}\n"
+                parts.append(f"- 仿真参数：{context['params']}\n")
             if "results" in context:
-                prompt += f"- 计算结果：{context['results']}\n"
+                parts.append(f"- 计算结果：{context['results']}\n")
             
             # Include current code if available
             if context.get("current_code"):
-                prompt += "\n【用户当前代码】\n"
-                prompt += f"```python\n{context['current_code']}\n```\n"
-                prompt += "请基于上述代码回答问题，可以解释代码逻辑、物理含义或提出改进建议。\n"
+                parts.append("\n【用户当前代码】\n")
+                parts.append(f"```python\n{context['current_code']}\n```\n")
+                parts.append("请基于上述代码回答问题，可以解释代码逻辑、物理含义或提出改进建议。\n")
             
             # Include code output if available
             if context.get("code_output"):
-                prompt += "\n【代码执行输出】\n"
-                prompt += f"```\n{context['code_output']}\n```\n"
+                parts.append("\n【代码执行输出】\n")
+                parts.append(f"```\n{context['code_output']}\n```\n")
             
             # Include plot info
             plots = context.get("plots_generated", 0)
             if plots and plots > 0:
-                prompt += f"\n注意：代码已生成 {plots} 张图表，用户可以看到可视化结果。\n"
+                parts.append(f"\n注意：代码已生成 {plots} 张图表，用户可以看到可视化结果。\n")
         
-        return prompt
+        return self._with_context(self.PRECOMPILED_PROMPT, parts)
 
 
 class SimGuideSkill(BaseSkill):
@@ -165,7 +185,7 @@ class SimGuideSkill(BaseSkill):
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for simulation guidance."""
-        return self.BASE_PROMPT + self.SKILL_PROMPT
+        return self.PRECOMPILED_PROMPT
 
 
 class CodeAssistSkill(BaseSkill):
@@ -204,17 +224,17 @@ MATLAB 代码规范：
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for code assistance."""
-        prompt = self.BASE_PROMPT + self.SKILL_PROMPT
+        parts: list[str] = []
         
         if context:
             if "language" in context:
-                prompt += f"\n当前编程语言：{context['language']}\n"
+                parts.append(f"\n当前编程语言：{context['language']}\n")
             if "code_snippet" in context:
-                prompt += f"\n用户代码片段：\n```\n{context['code_snippet']}\n```\n"
+                parts.append(f"\n用户代码片段：\n```\n{context['code_snippet']}\n```\n")
             if "error_message" in context:
-                prompt += f"\n错误信息：{context['error_message']}\n"
+                parts.append(f"\n错误信息：{context['error_message']}\n")
         
-        return prompt
+        return self._with_context(self.PRECOMPILED_PROMPT, parts)
 
 
 class FormulaDeriveSkill(BaseSkill):
@@ -253,7 +273,7 @@ class FormulaDeriveSkill(BaseSkill):
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for formula derivation."""
-        return self.BASE_PROMPT + self.SKILL_PROMPT
+        return self.PRECOMPILED_PROMPT
 
 
 class ProblemSolveSkill(BaseSkill):
@@ -288,15 +308,15 @@ class ProblemSolveSkill(BaseSkill):
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for problem solving."""
-        prompt = self.BASE_PROMPT + self.SKILL_PROMPT
+        parts: list[str] = []
         
         if context:
             if "chapter_title" in context:
-                prompt += f"\n当前章节：{context['chapter_title']}\n"
+                parts.append(f"\n当前章节：{context['chapter_title']}\n")
             if "knowledge_points" in context:
-                prompt += f"相关知识点：{', '.join(context['knowledge_points'])}\n"
+                parts.append(f"相关知识点：{', '.join(context['knowledge_points'])}\n")
         
-        return prompt
+        return self._with_context(self.PRECOMPILED_PROMPT, parts)
 
 
 class ConceptTutorSkill(BaseSkill):
@@ -329,15 +349,15 @@ class ConceptTutorSkill(BaseSkill):
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for concept tutoring."""
-        prompt = self.BASE_PROMPT + self.SKILL_PROMPT
+        parts: list[str] = []
         
         if context:
             if "chapter_title" in context:
-                prompt += f"\n当前章节：{context['chapter_title']}\n"
+                parts.append(f"\n当前章节：{context['chapter_title']}\n")
             if "knowledge_points" in context:
-                prompt += f"本章知识点：{', '.join(context['knowledge_points'])}\n"
+                parts.append(f"本章知识点：{', '.join(context['knowledge_points'])}\n")
         
-        return prompt
+        return self._with_context(self.PRECOMPILED_PROMPT, parts)
 
 
 class GraderSkill(BaseSkill):
@@ -371,12 +391,12 @@ class GraderSkill(BaseSkill):
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for grading assistance."""
-        prompt = self.BASE_PROMPT + self.SKILL_PROMPT
+        parts: list[str] = []
         
         if context:
             if "assignment_title" in context:
-                prompt += f"\n作业标题：{context['assignment_title']}\n"
+                parts.append(f"\n作业标题：{context['assignment_title']}\n")
             if "reference_answer" in context:
-                prompt += f"参考答案要点：{context['reference_answer']}\n"
+                parts.append(f"参考答案要点：{context['reference_answer']}\n")
         
-        return prompt
+        return self._with_context(self.PRECOMPILED_PROMPT, parts)
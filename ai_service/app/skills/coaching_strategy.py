@@ -22,14 +22,7 @@ class CoachingStrategySkill(BaseSkill):
     SKILL_PROMPT = """
 【当前任务：个性化辅导策略生成】
 
-你是一位经验丰富的研究生专业英文写作课程辅导教师。请基于学生的学习档案，生成个性化的辅导策略。
-
-## 学生学习档案
-- 学生 ID：{student_id}
-- 已完成主题：{completed_topics}
-- 已发现薄弱点：{weak_points}
-- 累计学习时长：{study_minutes} 分钟
-- 总学习会话数：{session_count} 次
+你是一位经验丰富的研究生专业英文写作课程辅导教师。请基于文末提供的学生学习档案，生成个性化的辅导策略。
 
 ## 任务要求
 
@@ -100,29 +93,21 @@ class CoachingStrategySkill(BaseSkill):
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for coaching strategy generation."""
-        prompt = self.BASE_PROMPT + self.SKILL_PROMPT
+        parts: list[str] = []
         
         if context:
-            # Fill in student profile data
-            prompt = prompt.replace("{student_id}", str(context.get("student_id", "未知")))
-            
+            # Student profile goes after the separator so the prefix stays cacheable
             completed = context.get("completed_topics", [])
-            if completed:
-                prompt = prompt.replace("{completed_topics}", "、".join(completed))
-            else:
-                prompt = prompt.replace("{completed_topics}", "暂无")
-            
             weak_points = context.get("weak_points", {})
-            if weak_points:
-                weak_str = "、".join([f"{k}({v}次)" for k, v in weak_points.items()])
-                prompt = prompt.replace("{weak_points}", weak_str)
-            else:
-                prompt = prompt.replace("{weak_points}", "暂无")
-            
-            prompt = prompt.replace("{study_minutes}", str(context.get("study_minutes", 0)))
-            prompt = prompt.replace("{session_count}", str(context.get("session_count", 0)))
+            weak_str = "、".join([f"{k}({v}次)" for k, v in weak_points.items()])
+            parts.append("\n## 学生学习档案\n")
+            parts.append(f"- 学生 ID：{context.get('student_id', '未知')}\n")
+            parts.append(f"- 已完成主题：{'、'.join(completed) or '暂无'}\n")
+            parts.append(f"- 已发现薄弱点：{weak_str or '暂无'}\n")
+            parts.append(f"- 累计学习时长：{context.get('study_minutes', 0)} 分钟\n")
+            parts.append(f"- 总学习会话数：{context.get('session_count', 0)} 次\n")
         
-        return prompt
+        return self._with_context(self.PRECOMPILED_PROMPT, parts)
     
     def build_analysis_prompt(self, context: Optional[dict] = None) -> str:
         """Build prompt for progress analysis."""
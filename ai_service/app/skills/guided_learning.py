@@ -75,52 +75,40 @@ class GuidedLearningSkill(BaseSkill):
 - ❌ 使用否定性语言（"你错了"、"不对"）
 - ❌ 跳过必要的前置知识
 
-## 当前学习状态
-- 学习目标：{learning_goal}
-- 学习路径：{learning_path_summary}
-- 当前步骤：第 {current_step}/{total_steps} 步
-- 当前步骤内容：{current_step_description}
-- 已发现薄弱点：{weak_points}
-
-## 课程知识库参考
-{rag_context}
-
-请基于以上状态，引导学生完成当前步骤。如果学生回答正确，给予肯定并引导进入下一步；如果回答不完整或有误，提供提示帮助他们发现问题。
+请基于文末提供的当前学习状态与课程知识库参考，引导学生完成当前步骤。如果学生回答正确，给予肯定并引导进入下一步；如果回答不完整或有误，提供提示帮助他们发现问题。
 """
     
     def build_system_prompt(self, context: Optional[dict] = None) -> str:
         """Build the system prompt for guided learning."""
-        prompt = self.BASE_PROMPT + self.SKILL_PROMPT
+        parts: list[str] = []
         
         if context:
-            # Fill in learning state
-            prompt = prompt.replace("{learning_goal}", context.get("learning_goal", "未设定"))
-            prompt = prompt.replace("{current_step}", str(context.get("current_step", 0) + 1))
-            prompt = prompt.replace("{total_steps}", str(context.get("total_steps", 1)))
-            prompt = prompt.replace("{weak_points}", ", ".join(context.get("weak_points", [])) or "暂无")
-            prompt = prompt.replace("{rag_context}", context.get("rag_context", ""))
-            
-            # Learning path summary
+            # Learning state goes after the separator so the prefix stays cacheable
             learning_path = context.get("learning_path", [])
+            current_idx = context.get("current_step", 0)
             if learning_path:
                 path_summary = "\n".join([
                     f"  {s.get('step', i+1)}. {'✅' if s.get('completed') else '⬜'} {s.get('title', '')}"
                     for i, s in enumerate(learning_path)
                 ])
-                prompt = prompt.replace("{learning_path_summary}", path_summary)
-                
-                # Current step description
-                current_idx = context.get("current_step", 0)
                 if 0 <= current_idx < len(learning_path):
                     current_desc = learning_path[current_idx].get("description", "")
-                    prompt = prompt.replace("{current_step_description}", current_desc)
                 else:
-                    prompt = prompt.replace("{current_step_description}", "完成学习")
+                    current_desc = "完成学习"
             else:
-                prompt = prompt.replace("{learning_path_summary}", "尚未生成学习路径")
-                prompt = prompt.replace("{current_step_description}", "")
+                path_summary = "尚未生成学习路径"
+                current_desc = ""
+            
+            parts.append("\n## 当前学习状态\n")
+            parts.append(f"- 学习目标：{context.get('learning_goal', '未设定')}\n")
+            parts.append(f"- 学习路径：{path_summary}\n")
+            parts.append(f"- 当前步骤：第 {current_idx + 1}/{context.get('total_steps', 1)} 步\n")
+            parts.append(f"- 当前步骤内容：{current_desc}\n")
+            parts.append(f"- 已发现薄弱点：{', '.join(context.get('weak_points', [])) or '暂无'}\n")
+            parts.append("\n## 课程知识库参考\n")
+            parts.append(f"{context.get('rag_context', '')}\n")
         
-        return prompt
+        return self._with_context(self.PRECOMPILED_PROMPT, parts)
     
     def build_learning_path_prompt(self, topic: str) -> str:
         """Build prompt for generating learning path."""
@@ -10,7 +10,7 @@ from __future__ import annotations
 import os
 import re
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Collection, Optional
 
 from app.writing_concepts import (
     WRITING_CONCEPTS,
@@ -111,7 +111,7 @@ DOMAIN_CONCEPTS: dict[str, dict[str, list[str]]] = {
     "writing": WRITING_CONCEPTS,
 }
 
-DOMAIN_INDICATORS: dict[str, tuple[list[str], list[str]]] = {
+DOMAIN_INDICATORS: dict[str, tuple[Collection[str], Collection[str]]] = {
     "emfield": (NEGATIVE_INDICATORS, POSITIVE_INDICATORS),
     "writing": (WRITING_NEGATIVE_INDICATORS, WRITING_POSITIVE_INDICATORS),
 }
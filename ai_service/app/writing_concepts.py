@@ -5,6 +5,11 @@ This module replaces the EM_CONCEPTS from weak_point_detector.py with
 writing-related concepts for the student-centric Professional English Writing course.
 """
 
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional accelerator
+    ahocorasick = None
+
 # Writing concepts for weak point detection
 WRITING_CONCEPTS = {
     # Academic Tone & Style
@@ -94,7 +99,7 @@ WRITING_TYPES = {
 }
 
 # Negative indicators for weak point detection
-NEGATIVE_INDICATORS = [
+NEGATIVE_INDICATORS = frozenset({
     "不够",
     "缺乏",
     "问题",
@@ -116,10 +121,10 @@ NEGATIVE_INDICATORS = [
     "try to",
     "consider",
     "avoid",
-]
+})
 
 # Positive indicators
-POSITIVE_INDICATORS = [
+POSITIVE_INDICATORS = frozenset({
     "很好",
     "准确",
     "恰当",
@@ -130,7 +135,7 @@ POSITIVE_INDICATORS = [
     "appropriate",
     "effective",
     "correct",
-]
+})
 
 
 def get_writing_type_info(writing_type: str) -> dict:
@@ -144,19 +149,46 @@ def get_evaluation_weights(writing_type: str) -> dict:
     return type_info.get("weights", {})
 
 
+def _build_keyword_index() -> dict:
+    """Map each lowercased keyword (and concept name) to the concepts it signals."""
+    index: dict[str, list[str]] = {}
+    for concept, keywords in WRITING_CONCEPTS.items():
+        # Also match the concept name itself (often appears in Chinese feedback)
+        for keyword in (concept, *keywords):
+            owners = index.setdefault(keyword.lower(), [])
+            if concept not in owners:
+                owners.append(concept)
+    return {keyword: tuple(owners) for keyword, owners in index.items()}
+
+
+def _build_automaton(index: dict):
+    """Compile the keyword index into a single Aho-Corasick automaton."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword, concepts in index.items():
+        automaton.add_word(keyword, concepts)
+    automaton.make_automaton()
+    return automaton
+
+
+_KEYWORD_INDEX = _build_keyword_index()
+_CONCEPT_AUTOMATON = _build_automaton(_KEYWORD_INDEX)
+
+
 def detect_writing_concepts(text: str) -> list:
     """Detect which writing concepts are mentioned in the text."""
     text_lower = text.lower()
-    detected = []
+    detected: set[str] = set()
     
-    for concept, keywords in WRITING_CONCEPTS.items():
-        # Also match the concept name itself (often appears in Chinese feedback)
-        if concept.lower() in text_lower:
-            detected.append(concept)
-            continue
-        for keyword in keywords:
-            if keyword.lower() in text_lower:
-                detected.append(concept)
-                break
+    if _CONCEPT_AUTOMATON is not None:
+        # One linear pass over the text yields every keyword hit
+        for _, concepts in _CONCEPT_AUTOMATON.iter(text_lower):
+            detected.update(concepts)
+        return list(detected)
+    
+    for keyword, concepts in _KEYWORD_INDEX.items():
+        if keyword in text_lower:
+            detected.update(concepts)
     
-    return list(set(detected))
+    return list(detected)
@@ -5,6 +5,10 @@ This module provides specialized prompts for different writing types
 to enable type-aware evaluation and feedback generation.
 """
 
+import heapq
+from functools import lru_cache
+from operator import itemgetter
+from pathlib import Path
 from typing import Optional
 
 
@@ -26,7 +30,7 @@ WRITING_ANALYSIS_SYSTEM_PROMPT = """你是一位专业的学术英文写作导
 评估维度包括：学术语气、段落结构、逻辑连接、引用规范、词汇使用、语法准确性等。
 """
 
-# Type-specific evaluation prompts
+# Type-specific evaluation prompts; evaluation templates live in prompts/<type>.md
 TYPE_PROMPTS = {
     "literature_review": {
         "name": "文献综述",
@@ -37,28 +41,6 @@ TYPE_PROMPTS = {
 - 批判性分析：是否对现有研究进行了评价，而非简单罗列
 - 研究空白的识别：是否指出了现有研究的不足或空白
 - 逻辑组织：是否按主题而非按文献来组织内容
-""",
-        "evaluation_template": """
-请对以下文献综述进行评估：
-
----
-{content}
----
-
-请从以下维度进行分析（按重要性排序）：
-1. **文献综合能力** (25%)：是否有效整合了多个来源？是否形成了连贯的叙述？
-2. **批判性思维** (20%)：是否对文献进行了批判性分析？是否指出了研究局限？
-3. **逻辑连接** (15%)：段落之间是否有清晰的过渡？论述是否连贯？
-4. **引用规范** (15%)：引用格式是否正确？是否恰当使用了改述和直接引用？
-5. **学术语气** (10%)：语言是否正式、客观？是否使用了hedging语言？
-6. **段落结构** (10%)：段落是否有明确的主题句和支撑句？
-7. **语法准确性** (5%)：是否有明显的语法错误？
-
-请给出：
-- 每个维度的评分（1-10分）和简要评语
-- 3个主要优点
-- 3个需要改进的地方（附具体建议）
-- 总体评分和总结性建议
 """,
     },
     
@@ -71,28 +53,6 @@ TYPE_PROMPTS = {
 - 结构是否完整（引言-正文-结论）
 - 段落内部的论证是否充分
 - 学术规范是否得到遵守
-""",
-        "evaluation_template": """
-请对以下课程论文进行评估：
-
----
-{content}
----
-
-请从以下维度进行分析（按重要性排序）：
-1. **论点展开** (25%)：论点是否明确？论证是否有力？
-2. **证据支持** (20%)：是否使用了充分的证据？证据是否与论点相关？
-3. **段落结构** (15%)：段落组织是否清晰？是否遵循了topic-support-conclude结构？
-4. **逻辑连接** (15%)：论证逻辑是否清晰？过渡是否自然？
-5. **引用规范** (10%)：是否正确引用了来源？
-6. **学术语气** (10%)：语言是否符合学术写作规范？
-7. **语法准确性** (5%)：是否有语法错误？
-
-请给出：
-- 每个维度的评分（1-10分）和简要评语
-- 3个主要优点
-- 3个需要改进的地方（附具体建议）
-- 总体评分和总结性建议
 """,
     },
     
@@ -105,29 +65,6 @@ TYPE_PROMPTS = {
 - 研究贡献是否明确
 - 论文结构是否完整规范
 - 学术严谨性
-""",
-        "evaluation_template": """
-请对以下学位论文片段进行评估：
-
----
-{content}
----
-
-请从以下维度进行分析（按重要性排序）：
-1. **研究问题** (20%)：研究问题是否清晰？是否有研究价值？
-2. **研究方法** (20%)：方法描述是否清晰？方法选择是否合理？
-3. **论点展开** (15%)：论证是否严谨？逻辑是否清晰？
-4. **证据支持** (15%)：数据/证据是否充分？分析是否深入？
-5. **批判性思维** (10%)：是否展现了对研究局限的认识？
-6. **引用规范** (10%)：学术引用是否规范？
-7. **学术语气** (5%)：语言是否符合学位论文要求？
-8. **语法准确性** (5%)：是否有语言错误？
-
-请给出：
-- 每个维度的评分（1-10分）和简要评语
-- 3个主要优点
-- 3个需要改进的地方（附具体建议）
-- 总体评分和针对学位论文的具体建议
 """,
     },
     
@@ -140,31 +77,32 @@ TYPE_PROMPTS = {
 - 信息是否完整且突出重点
 - 是否符合字数要求（通常150-300词）
 - 是否使用了恰当的时态和语态
-""",
-        "evaluation_template": """
-请对以下摘要进行评估：
-
----
-{content}
----
-
-请从以下维度进行分析（按重要性排序）：
-1. **摘要完整性** (30%)：是否包含背景/目的/方法/结果/结论？各部分比例是否合适？
-2. **逻辑连接** (20%)：信息组织是否有逻辑？过渡是否自然？
-3. **学术语气** (20%)：语言是否简洁、客观、正式？
-4. **词汇丰富度** (15%)：词汇使用是否准确、精炼？
-5. **语法准确性** (15%)：是否有语法错误？时态使用是否正确？
-
-请给出：
-- 每个维度的评分（1-10分）和简要评语
-- 2个主要优点
-- 2个需要改进的地方（附具体建议）
-- 修改后的示范摘要（如果需要）
-- 总体评分
 """,
     },
 }
 
+_PROMPT_DIR = Path(__file__).parent / "prompts"
+
+_WEAK_POINT_COUNT = itemgetter(1)
+
+# Content longer than this bypasses the prompt cache
+_PROMPT_CACHE_MAX_CONTENT = 100_000
+
+# WRITING_ANALYSIS_SYSTEM_PROMPT + system_addition per type, built once at import.
+# The combined string is the stable prefix; personalization is only ever appended.
+_COMBINED_SYSTEM_PROMPTS = {
+    writing_type: WRITING_ANALYSIS_SYSTEM_PROMPT + info["system_addition"]
+    for writing_type, info in TYPE_PROMPTS.items()
+}
+
+
+@lru_cache(maxsize=8)
+def get_evaluation_template(writing_type: str) -> str:
+    """Load the evaluation template for a writing type, reading it once per type."""
+    if writing_type not in TYPE_PROMPTS:
+        writing_type = "course_paper"
+    return (_PROMPT_DIR / f"{writing_type}.md").read_text(encoding="utf-8")
+
 
 def get_writing_analysis_prompt(
     content: str, 
@@ -174,6 +112,9 @@ def get_writing_analysis_prompt(
     """
     Generate system prompt and user prompt for writing analysis.
     
+    Results are memoized on (content, writing_type, weak points), so retries
+    of the same submission skip the template formatting.
+    
     Args:
         content: The writing content to analyze
         writing_type: Type of writing (literature_review, course_paper, thesis, abstract)
@@ -182,28 +123,45 @@ def get_writing_analysis_prompt(
     Returns:
         Tuple of (system_prompt, user_prompt)
     """
-    # Get type-specific info
-    type_info = TYPE_PROMPTS.get(writing_type, TYPE_PROMPTS["course_paper"])
+    weak_points = student_profile.get("weak_points") if student_profile else None
+    frozen_weak_points = tuple(weak_points.items()) if weak_points else ()
     
+    # Hashing very large content for the cache key costs more than it saves
+    if len(content) <= _PROMPT_CACHE_MAX_CONTENT:
+        try:
+            return _build_writing_analysis_prompt(
+                content, writing_type, frozen_weak_points
+            )
+        except TypeError:
+            pass  # Unhashable profile values; build without caching
+    return _build_writing_analysis_prompt.__wrapped__(
+        content, writing_type, frozen_weak_points
+    )
+
+
+@lru_cache(maxsize=256)
+def _build_writing_analysis_prompt(
+    content: str,
+    writing_type: str,
+    weak_points: tuple[tuple[str, int], ...],
+) -> tuple[str, str]:
     # Build system prompt
-    system_prompt = WRITING_ANALYSIS_SYSTEM_PROMPT + type_info["system_addition"]
+    system_prompt = _COMBINED_SYSTEM_PROMPTS.get(
+        writing_type, _COMBINED_SYSTEM_PROMPTS["course_paper"]
+    )
     
     # Add personalization if profile available
-    if student_profile:
-        weak_points = student_profile.get("weak_points", {})
-        if weak_points:
-            top_weak = sorted(weak_points.items(), key=lambda x: x[1], reverse=True)[:3]
-            system_prompt += f"\n\n该学生的历史薄弱点：{', '.join([w[0] for w in top_weak])}。请在这些方面给予更详细的指导。"
+    if weak_points:
+        top_weak = heapq.nlargest(3, weak_points, key=_WEAK_POINT_COUNT)
+        system_prompt += f"\n\n该学生的历史薄弱点：{', '.join([w[0] for w in top_weak])}。请在这些方面给予更详细的指导。"
     
     # Build user prompt
-    user_prompt = type_info["evaluation_template"].format(content=content)
+    user_prompt = get_evaluation_template(writing_type).format(content=content)
     
     return system_prompt, user_prompt
 
 
-def get_polish_prompt(content: str, focus_areas: list = None) -> tuple[str, str]:
-    """Generate prompts for text polishing."""
-    system_prompt = """你是一位专业的学术英文写作编辑，帮助学生润色学术写作。
+_POLISH_SYSTEM_PROMPT = """你是一位专业的学术英文写作编辑，帮助学生润色学术写作。
 
 你的任务是：
 1. 保持原意的基础上改进语言表达
@@ -215,18 +173,16 @@ def get_polish_prompt(content: str, focus_areas: list = None) -> tuple[str, str]
 - 润色后的文本
 - 主要修改列表（每处修改解释原因）
 """
-    
-    focus_text = ""
-    if focus_areas:
-        focus_text = f"\n请特别关注以下方面：{', '.join(focus_areas)}"
-    
-    user_prompt = f"""请润色以下学术写作：{focus_text}
 
----
-{content}
----
 
-请提供润色后的版本和修改说明。
-"""
+def get_polish_prompt(content: str, focus_areas: tuple[str, ...] = ()) -> tuple[str, str]:
+    """Generate prompts for text polishing."""
+    parts = ["请润色以下学术写作："]
+    if focus_areas:
+        parts.append("\n请特别关注以下方面：")
+        parts.append(", ".join(focus_areas))
+    parts.append("\n\n---\n")
+    parts.append(content)
+    parts.append("\n---\n\n请提供润色后的版本和修改说明。\n")
     
-    return system_prompt, user_prompt
+    return _POLISH_SYSTEM_PROMPT, "".join(parts)
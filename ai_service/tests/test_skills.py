@@ -0,0 +1,45 @@
+"""
+Tests for skill system prompts.
+"""
+
+import pytest
+from app.skills import BaseSkill, get_all_skills, get_skill
+
+
+class TestPromptPrefix:
+    """System prompts should keep an invariant, cacheable prefix."""
+
+    @pytest.mark.parametrize(
+        "skill_id",
+        [
+            "sim_qa", "code_assist", "problem_solve", "concept_tutor", "grader",
+            "guided_learning", "coaching_strategy",
+        ],
+    )
+    def test_context_does_not_change_prefix(self, skill_id):
+        """Context is appended after the precompiled prefix, never spliced in."""
+        skill = get_skill(skill_id)
+        context = {
+            "sim_type": "laplace2d",
+            "language": "python",
+            "chapter_title": "第一章",
+            "knowledge_points": ["thesis statement"],
+            "assignment_title": "Essay 1",
+            "learning_goal": "Write an abstract",
+            "student_id": 7,
+        }
+        prompt = skill.build_system_prompt(context)
+
+        assert prompt.startswith(skill.PRECOMPILED_PROMPT + BaseSkill.CONTEXT_SEPARATOR)
+
+    def test_no_context_returns_prefix_only(self):
+        """Without context the prompt is exactly the precompiled prefix."""
+        for skill_id in ("sim_qa", "sim_guide", "formula_derive", "grader"):
+            skill = get_skill(skill_id)
+            assert skill.build_system_prompt() == skill.PRECOMPILED_PROMPT
+            assert skill.build_system_prompt({}) == skill.PRECOMPILED_PROMPT
+
+    def test_prefix_starts_with_base_prompt(self):
+        """Every precompiled prefix leads with the shared base prompt."""
+        for skill in get_all_skills().values():
+            assert skill.PRECOMPILED_PROMPT.startswith(BaseSkill.BASE_PROMPT)
@@ -0,0 +1,39 @@
+"""
+Tests for writing_concepts module.
+"""
+
+import pytest
+from app import writing_concepts
+from app.writing_concepts import detect_writing_concepts
+
+
+@pytest.fixture(params=["automaton", "fallback"])
+def matcher(request, monkeypatch):
+    """Run each test against both the automaton and the plain scan."""
+    if request.param == "fallback":
+        monkeypatch.setattr(writing_concepts, "_CONCEPT_AUTOMATON", None)
+    elif writing_concepts._CONCEPT_AUTOMATON is None:
+        pytest.skip("pyahocorasick not installed")
+    return detect_writing_concepts
+
+
+class TestDetectWritingConcepts:
+    """Test keyword-based writing concept detection."""
+
+    def test_keyword_match_is_case_insensitive(self, matcher):
+        """Keywords should match regardless of case."""
+        assert "引用规范" in matcher("Please fix the APA Citation format.")
+
+    def test_concept_name_matches(self, matcher):
+        """The Chinese concept name itself should be detected."""
+        assert matcher("注意学术语气的使用") == ["学术语气"]
+
+    def test_shared_keyword_maps_to_all_concepts(self, matcher):
+        """A keyword listed under several concepts should flag each of them."""
+        result = matcher("more critical analysis is needed")
+        assert {"文献综合", "批判性思维"} <= set(result)
+
+    def test_no_match_returns_empty(self, matcher):
+        """Text without any keyword should return an empty list."""
+        assert matcher("") == []
+        assert matcher("nothing relevant here") == []
@@ -0,0 +1,46 @@
+"""
+Tests for writing_prompts module.
+"""
+
+from app.writing_prompts import (
+    WRITING_ANALYSIS_SYSTEM_PROMPT,
+    _build_writing_analysis_prompt,
+    get_writing_analysis_prompt,
+)
+
+
+class TestWritingAnalysisPrompt:
+    """Test get_writing_analysis_prompt."""
+
+    def test_system_prompt_starts_with_base(self):
+        """The shared base prompt should lead every type's system prompt."""
+        system_prompt, user_prompt = get_writing_analysis_prompt("Some text.", "thesis")
+        assert system_prompt.startswith(WRITING_ANALYSIS_SYSTEM_PROMPT)
+        assert "Some text." in user_prompt
+
+    def test_unknown_type_falls_back_to_course_paper(self):
+        """Unknown writing types should use the course_paper prompts."""
+        assert get_writing_analysis_prompt("x", "unknown") == get_writing_analysis_prompt(
+            "x", "course_paper"
+        )
+
+    def test_top_three_weak_points_appended(self):
+        """Only the three most frequent weak points are mentioned, in order."""
+        profile = {"weak_points": {"引用规范": 1, "学术语气": 5, "逻辑连接": 3, "段落结构": 4}}
+        system_prompt, _ = get_writing_analysis_prompt("x", "thesis", profile)
+        assert system_prompt.endswith(
+            "该学生的历史薄弱点：学术语气, 段落结构, 逻辑连接。请在这些方面给予更详细的指导。"
+        )
+
+    def test_repeated_call_hits_cache(self):
+        """Identical inputs should be served from the prompt cache."""
+        _build_writing_analysis_prompt.cache_clear()
+        first = get_writing_analysis_prompt("cached", "abstract", {"weak_points": {"a": 1}})
+        second = get_writing_analysis_prompt("cached", "abstract", {"weak_points": {"a": 1}})
+        assert first == second
+        assert _build_writing_analysis_prompt.cache_info().hits == 1
+
+    def test_unhashable_profile_values_bypass_cache(self):
+        """Profiles with unhashable values still produce a prompt."""
+        system_prompt, _ = get_writing_analysis_prompt("x", "thesis", {"weak_points": {"a": [1]}})
+        assert "该学生的历史薄弱点：a" in system_prompt
@@ -10,12 +10,53 @@ from __future__ import annotations
 
 import argparse
 import json
+import mmap
+import os
 import re
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain, islice
 from pathlib import Path
-from typing import Any, Dict, List, Tuple
+from typing import (
+    Any,
+    Callable,
+    DefaultDict,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
 
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional speedup
+    ahocorasick = None
 
-def parse_args() -> argparse.Namespace:
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+_BRACKET_RE = re.compile(r"\[([^\]]+)\]")
+
+PARALLEL_MIN_SAMPLES = 10_000
+SCORE_CHUNK_SIZE = 1024
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type.
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+
+def dumps_pretty(obj: Any) -> str:
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS
+        return orjson.dumps(obj, option=option).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Evaluate model outputs against benchmark.")
     parser.add_argument("--eval_file", type=str, required=True)
     parser.add_argument("--pred_file", type=str, required=True)
@@ -25,29 +66,86 @@ def parse_args() -> argparse.Namespace:
                         help="Output format: json or markdown")
     parser.add_argument("--group_by_type", action="store_true",
                         help="Group statistics by query type")
-    return parser.parse_args()
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Scoring processes (0 = cpu count, 1 = serial); "
+                             f"small benchmarks (<{PARALLEL_MIN_SAMPLES}) always run serially")
+    return parser.parse_args(argv)
+
+
+def iter_jsonl(path: Path) -> Iterator[Dict[str, Any]]:
+    """Yield parsed JSONL records one at a time, skipping blank/invalid lines."""
+    # mmap + byte-level splitting: lines go to the parser as bytes, never decoded to str
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            size = len(mm)
+            while start < size:
+                end = mm.find(b"\n", start)
+                if end == -1:
+                    end = size
+                line = mm[start:end].strip()
+                start = end + 1
+                if not line:
+                    continue
+                try:
+                    yield _json_loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
 
 
-def load_jsonl(path: Path) -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line:
-                continue
-            try:
-                items.append(json.loads(line))
-            except json.JSONDecodeError:
-                continue
-    return items
+def normalize_text(text: str) -> str:
+    # str.split() collapses the same whitespace set as \s+ and drops the ends
+    return " ".join(text.split()).lower()
 
 
-def normalize_text(text: str) -> str:
-    return re.sub(r"\s+", " ", text).strip().lower()
+# Key points repeat across samples; responses are unique, so only points are memoized.
+normalize_point = lru_cache(maxsize=8192)(normalize_text)
+
+
+@lru_cache(maxsize=1024)
+def _points_automaton(points: Tuple[str, ...]) -> Any:
+    """Compile normalized key points into one automaton; values are point indices."""
+    owners: Dict[str, List[int]] = {}
+    for i, point in enumerate(points):
+        point_norm = normalize_point(point)
+        if point_norm:
+            owners.setdefault(point_norm, []).append(i)
+    if not owners:
+        return None
+    automaton = ahocorasick.Automaton()
+    for point_norm, indices in owners.items():
+        automaton.add_word(point_norm, tuple(indices))
+    automaton.make_automaton()
+    return automaton
+
+
+def count_covered_points(points: List[Any], response_norm: str) -> int:
+    if ahocorasick is None:
+        covered = 0
+        for point in points:
+            point_norm = normalize_point(str(point))
+            if point_norm and point_norm in response_norm:
+                covered += 1
+        return covered
+    automaton = _points_automaton(tuple(map(str, points)))
+    if automaton is None:
+        return 0
+    hit: set = set()
+    for _, indices in automaton.iter(response_norm):
+        hit.update(indices)
+    return len(hit)
+
+
+RESPONSE_KEYS = ("response", "output", "text", "assistant")
+SCHEMA_SNIFF_SIZE = 100
+
+ResponseExtractor = Callable[[Dict[str, Any]], str]
 
 
 def extract_response(sample: Dict[str, Any]) -> str:
-    for key in ("response", "output", "text", "assistant"):
+    for key in RESPONSE_KEYS:
         if key in sample:
             return str(sample.get(key) or "")
     messages = sample.get("messages")
@@ -58,17 +156,32 @@ def extract_response(sample: Dict[str, Any]) -> str:
     return ""
 
 
+def extract_response_key(sample: Dict[str, Any]) -> str:
+    # "response" has top priority in extract_response, so one probe is exact
+    if "response" in sample:
+        return str(sample["response"] or "")
+    return extract_response(sample)
+
+
+def select_response_extractor(predictions: Iterable[Dict[str, Any]]) -> ResponseExtractor:
+    """Pick a specialized extractor from the schema of the first predictions."""
+    sniffed = list(islice(predictions, SCHEMA_SNIFF_SIZE))
+    with_response = sum(1 for item in sniffed if "response" in item)
+    if sniffed and with_response * 2 > len(sniffed):
+        return extract_response_key
+    return extract_response
+
+
 def extract_citations(sample: Dict[str, Any], response: str) -> List[str]:
     citations = sample.get("citations") or sample.get("references")
     if isinstance(citations, list):
-        return [str(x) for x in citations if x]
-    matches = re.findall(r"\[([^\]]+)\]", response)
+        return list(map(str, filter(None, citations)))
     results: List[str] = []
-    for m in matches:
-        for token in re.split(r"[,\s]+", m):
-            token = token.strip()
-            if token:
-                results.append(token)
+    for m in _BRACKET_RE.findall(response):
+        # Same tokens as splitting on [,\s]+ and dropping empties, without a regex
+        if "," in m:
+            m = m.replace(",", " ")
+        results.extend(m.split())
     return results
 
 
@@ -87,19 +200,44 @@ def extract_tool_calls(sample: Dict[str, Any]) -> List[str]:
     return []
 
 
+REFUSAL_KEYWORDS = (
+    "无法", "不能", "不足", "缺少", "需要更多", "超出", "不确定", "资料不足", "无法确定"
+)
+
+
+def _build_keyword_automaton(keywords: Tuple[str, ...]) -> Any:
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+
+_REFUSAL_AC = _build_keyword_automaton(REFUSAL_KEYWORDS)
+
+
 def detect_refusal(response: str) -> bool:
     text = response.strip()
     if not text:
         return False
-    keywords = [
-        "无法", "不能", "不足", "缺少", "需要更多", "超出", "不确定", "资料不足", "无法确定"
-    ]
-    return any(k in text for k in keywords)
+    if _REFUSAL_AC is not None:
+        # Stops at the first keyword hit
+        return next(_REFUSAL_AC.iter(text), None) is not None
+    return any(k in text for k in REFUSAL_KEYWORDS)
+
+
+FORMAT_SECTIONS = ("### 结论", "### 推导", "### 检查")
+_FORMAT_AC = _build_keyword_automaton(FORMAT_SECTIONS)
 
 
 def check_format(response: str) -> bool:
-    required = ["### 结论", "### 推导", "### 检查"]
-    return all(r in response for r in required)
+    # Sections may appear in any order; all of them must be present.
+    if _FORMAT_AC is not None:
+        found = {section for _, section in _FORMAT_AC.iter(response)}
+        return len(found) == len(FORMAT_SECTIONS)
+    return all(r in response for r in FORMAT_SECTIONS)
 
 
 def ratio(numerator: int, denominator: int) -> float:
@@ -111,6 +249,7 @@ def ratio(numerator: int, denominator: int) -> float:
 def score_sample(
     expected: Dict[str, Any],
     prediction: Dict[str, Any] | None,
+    extract: ResponseExtractor = extract_response,
 ) -> Tuple[Dict[str, Any], Dict[str, float]]:
     result: Dict[str, Any] = {}
     metrics: Dict[str, float] = {}
@@ -119,7 +258,7 @@ def score_sample(
         result["missing_prediction"] = True
         return result, metrics
 
-    response = extract_response(prediction)
+    response = extract(prediction)
     expected_points = expected.get("key_points") or []
     expected_citations = expected.get("citations") or []
     expected_tools = expected.get("tool_calls") or []
@@ -128,19 +267,15 @@ def score_sample(
     response_norm = normalize_text(response)
 
     if expected_points:
-        covered = 0
-        for point in expected_points:
-            point_norm = normalize_text(str(point))
-            if point_norm and point_norm in response_norm:
-                covered += 1
+        covered = count_covered_points(expected_points, response_norm)
         metrics["key_point_coverage"] = ratio(covered, len(expected_points))
         result["key_points_hit"] = covered
         result["key_points_total"] = len(expected_points)
 
     if expected_citations:
         pred_citations = extract_citations(prediction, response)
-        expected_set = set(str(x) for x in expected_citations)
-        pred_set = set(str(x) for x in pred_citations)
+        expected_set = {*map(str, expected_citations)}
+        pred_set = {*map(str, pred_citations)}
         hit = len(expected_set & pred_set)
         metrics["citation_accuracy"] = ratio(hit, len(expected_set))
         result["citations_hit"] = hit
@@ -148,8 +283,8 @@ def score_sample(
 
     if expected_tools:
         pred_tools = extract_tool_calls(prediction)
-        expected_set = set(str(x) for x in expected_tools)
-        pred_set = set(str(x) for x in pred_tools)
+        expected_set = {*map(str, expected_tools)}
+        pred_set = {*map(str, pred_tools)}
         hit = len(expected_set & pred_set)
         metrics["tool_call_accuracy"] = ratio(hit, len(expected_set))
         result["tool_calls_hit"] = hit
@@ -169,56 +304,172 @@ def score_sample(
     return result, metrics
 
 
-def average_metric(values: List[float]) -> float:
-    if not values:
-        return 0.0
-    return sum(values) / len(values)
-
-
-def main() -> None:
-    args = parse_args()
-    eval_items = load_jsonl(Path(args.eval_file))
-    pred_items = load_jsonl(Path(args.pred_file))
-
-    pred_map = {item.get("id"): item for item in pred_items if item.get("id")}
-
-    summary_values: Dict[str, List[float]] = {}
-    type_values: Dict[str, Dict[str, List[float]]] = {}
-    details: List[Dict[str, Any]] = []
-
-    for sample in eval_items:
-        sample_id = sample.get("id")
-        expected = sample.get("expected", {})
-        sample_type = sample.get("type", "unknown")
-        pred = pred_map.get(sample_id)
-        result, metrics = score_sample(expected, pred)
-
-        for key, value in metrics.items():
-            summary_values.setdefault(key, []).append(value)
-            # Group by type
-            if args.group_by_type:
-                type_values.setdefault(sample_type, {}).setdefault(key, []).append(value)
-
-        if args.dump_details:
-            details.append({
-                "id": sample_id,
-                "type": sample_type,
-                "metrics": metrics,
-                "result": result,
-            })
-
-    summary = {key: average_metric(values) for key, values in summary_values.items()}
+ScoredSample = Tuple[Any, str, Dict[str, Any], Dict[str, float]]
+
+
+def score_eval_sample(
+    sample: Dict[str, Any],
+    pred_map: Dict[Any, Dict[str, Any]],
+    extract: ResponseExtractor = extract_response,
+) -> ScoredSample:
+    sample_id = sample.get("id")
+    expected = sample.get("expected", {})
+    sample_type = sample.get("type", "unknown")
+    result, metrics = score_sample(expected, pred_map.get(sample_id), extract)
+    return sample_id, sample_type, result, metrics
+
+
+# Set in each worker by the pool initializer so pred_map is pickled once per process.
+_WORKER_PRED_MAP: Dict[Any, Dict[str, Any]] = {}
+_WORKER_EXTRACT: ResponseExtractor = extract_response
+
+
+def _init_worker(pred_map: Dict[Any, Dict[str, Any]], extract: ResponseExtractor) -> None:
+    global _WORKER_PRED_MAP, _WORKER_EXTRACT
+    _WORKER_PRED_MAP = pred_map
+    _WORKER_EXTRACT = extract
+
+
+def _score_chunk(samples: List[Dict[str, Any]]) -> List[ScoredSample]:
+    return [
+        score_eval_sample(sample, _WORKER_PRED_MAP, _WORKER_EXTRACT) for sample in samples
+    ]
+
+
+def iter_chunks(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    it = iter(items)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_scored(
+    samples: Iterable[Dict[str, Any]],
+    pred_map: Dict[Any, Dict[str, Any]],
+    workers: int,
+    extract: ResponseExtractor = extract_response,
+) -> Iterator[ScoredSample]:
+    """Score samples in input order, fanning out to processes for large benchmarks."""
+    samples = iter(samples)
+    head = list(islice(samples, PARALLEL_MIN_SAMPLES))
+    if workers <= 1 or len(head) < PARALLEL_MIN_SAMPLES:
+        for sample in chain(head, samples):
+            yield score_eval_sample(sample, pred_map, extract)
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(pred_map, extract)
+    ) as executor:
+        # Bound the number of in-flight chunks so the eval file stays streamed.
+        pending: deque = deque()
+        for chunk in iter_chunks(chain(head, samples), SCORE_CHUNK_SIZE):
+            pending.append(executor.submit(_score_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# metric name -> [running sum, sample count]; O(metrics) memory however many samples
+MetricTotals = DefaultDict[str, List[float]]
+
+
+def _zero_total() -> List[float]:
+    return [0.0, 0]
+
+
+def new_totals() -> MetricTotals:
+    return defaultdict(_zero_total)
+
+
+def accumulate(totals: MetricTotals, metrics: Dict[str, float]) -> None:
+    for key, value in metrics.items():
+        entry = totals[key]
+        entry[0] += value
+        entry[1] += 1
+
+
+def average_metrics(totals: MetricTotals) -> Dict[str, float]:
+    return {key: (total / n if n else 0.0) for key, (total, n) in totals.items()}
+
+
+def _run_flat(
+    scored: Iterable[ScoredSample],
+    details: Optional[List[Dict[str, Any]]],
+) -> Tuple[int, MetricTotals, Dict[str, MetricTotals]]:
+    summary_totals = new_totals()
+    count = 0
+    for sample_id, sample_type, result, metrics in scored:
+        count += 1
+        accumulate(summary_totals, metrics)
+        if details is not None:
+            details.append(_detail_entry(sample_id, sample_type, result, metrics))
+    return count, summary_totals, {}
+
+
+def _run_grouped(
+    scored: Iterable[ScoredSample],
+    details: Optional[List[Dict[str, Any]]],
+) -> Tuple[int, MetricTotals, Dict[str, MetricTotals]]:
+    summary_totals = new_totals()
+    type_totals: DefaultDict[str, MetricTotals] = defaultdict(new_totals)
+    count = 0
+    for sample_id, sample_type, result, metrics in scored:
+        count += 1
+        accumulate(summary_totals, metrics)
+        if metrics:
+            accumulate(type_totals[sample_type], metrics)
+        if details is not None:
+            details.append(_detail_entry(sample_id, sample_type, result, metrics))
+    return count, summary_totals, type_totals
+
+
+def _detail_entry(
+    sample_id: Any,
+    sample_type: str,
+    result: Dict[str, Any],
+    metrics: Dict[str, float],
+) -> Dict[str, Any]:
+    return {
+        "id": sample_id,
+        "type": sample_type,
+        "metrics": metrics,
+        "result": result,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+    # Only the prediction lookup is held in memory; eval samples are streamed.
+    pred_map = {
+        item.get("id"): item
+        for item in iter_jsonl(Path(args.pred_file))
+        if item.get("id")
+    }
+
+    details: Optional[List[Dict[str, Any]]] = [] if args.dump_details else None
+
+    workers = args.workers or os.cpu_count() or 1
+    extract = select_response_extractor(pred_map.values())
+    scored = iter_scored(iter_jsonl(Path(args.eval_file)), pred_map, workers, extract)
+    # Pick the loop once so the per-sample body has no group_by_type branch
+    run = _run_grouped if args.group_by_type else _run_flat
+    count, summary_totals, type_totals = run(scored, details)
+
+    summary = average_metrics(summary_totals)
     report: Dict[str, Any] = {
         "summary": summary,
-        "count": len(eval_items),
+        "count": count,
     }
 
     if args.group_by_type:
         type_summary = {}
-        for t, metrics_dict in type_values.items():
+        for t, totals in type_totals.items():
             type_summary[t] = {
-                "count": len(next(iter(metrics_dict.values()), [])),
-                "metrics": {k: average_metric(v) for k, v in metrics_dict.items()}
+                "count": next(iter(totals.values()), _zero_total())[1],
+                "metrics": average_metrics(totals),
             }
         report["by_type"] = type_summary
 
@@ -235,8 +486,8 @@ def main() -> None:
         print(f"Markdown report saved to: {md_path}")
     
     # Always save JSON as well
-    output_path.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
-    print(json.dumps(report["summary"], ensure_ascii=False, indent=2))
+    output_path.write_text(dumps_pretty(report), encoding="utf-8")
+    print(dumps_pretty(report["summary"]))
 
 
 def generate_markdown_report(
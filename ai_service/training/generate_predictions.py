@@ -12,9 +12,14 @@ Usage:
 from __future__ import annotations
 
 import argparse
+import hashlib
+import importlib.util
 import json
+import os
+import re
+from itertools import groupby
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
@@ -24,6 +29,38 @@ try:
 except ImportError as exc:
     raise SystemExit("Missing dependency: peft. Install with: pip install peft") from exc
 
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - optional speedup
+    ahocorasick = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type.
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+JSONL_BUFFER_SIZE = 1 << 16
+
+_TOOL_PATTERNS = [
+    re.compile(r"<tool_calls>(.*?)</tool_calls>", re.DOTALL),
+    re.compile(r'"function":\s*\{\s*"name":\s*"([^"]+)"', re.DOTALL),
+    re.compile(r"调用(?:工具|函数)[:：]\s*(\w+)", re.DOTALL),
+]
+_NAME_RE = re.compile(r'"name":\s*"([^"]+)"')
+_CITE_RE = re.compile(r"\[([^\]]+)\]")
+# A citation token: a run between commas/whitespace that does not start with "#"
+_CITE_TOKEN_RE = re.compile(r"(?<![^,\s])[^,\s#][^,\s]*")
+
+
+def dumps_line(obj: Any) -> bytes:
+    """Serialize one JSONL record, newline included."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
 
 DEFAULT_SYSTEM_PROMPT = (
     "你是通用教学平台的 AI 助教。请按以下结构回答：\n"
@@ -33,7 +70,7 @@ DEFAULT_SYSTEM_PROMPT = (
 )
 
 
-def parse_args() -> argparse.Namespace:
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Generate predictions using LoRA adapter")
     parser.add_argument("--model_name_or_path", type=str, required=True,
                         help="Base model name or path")
@@ -51,27 +88,61 @@ def parse_args() -> argparse.Namespace:
                         help="Sampling temperature")
     parser.add_argument("--top_p", type=float, default=0.9,
                         help="Top-p sampling parameter")
+    parser.add_argument("--quant", type=str, choices=["none", "bnb4", "gptq", "awq"],
+                        default="none",
+                        help="Weight quantization: gptq/awq load a pre-quantized int4 "
+                             "checkpoint with fused inference kernels; bnb4 is NF4")
     parser.add_argument("--use_4bit", action="store_true",
-                        help="Load base model in 4-bit quantization")
+                        help="Deprecated alias for --quant bnb4")
     parser.add_argument("--bf16", action="store_true",
                         help="Use bfloat16 precision")
     parser.add_argument("--system_prompt", type=str, default="",
                         help="Override system prompt (optional)")
     parser.add_argument("--limit", type=int, default=0,
                         help="Limit number of eval samples (0 = no limit)")
-    return parser.parse_args()
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed (0 = no seed)")
+    parser.add_argument("--tensor_parallel", action="store_true",
+                        help="hf engine: shard the model across GPUs with tp_plan=\"auto\"; "
+                             "launch with torchrun --nproc-per-node N")
+    parser.add_argument("--engine", type=str, choices=["hf", "pipeline", "vllm"], default="hf",
+                        help="Generation backend: hf (transformers generate), pipeline "
+                             "(text-generation pipeline over a Dataset, tokenization "
+                             "prefetched by a DataLoader) or vllm (continuous batching, "
+                             "LoRA applied per request)")
+    parser.add_argument("--compile", action="store_true",
+                        help="hf engine: merge the adapter, use a static KV cache and "
+                             "torch.compile the forward pass (CUDA-graph decode)")
+    parser.add_argument("--assistant_model", type=str, default="",
+                        help="hf engine: small draft model sharing the tokenizer for "
+                             "speculative decoding (best with --temperature 0; batch size 1)")
+    parser.add_argument("--merged_cache", type=str, default="",
+                        help="hf engine: directory for base+adapter merged weights; "
+                             "written on the first run, reused while the base model "
+                             "and adapter are unchanged")
+    parser.add_argument("--attn_implementation", type=str,
+                        choices=["auto", "flash_attention_2", "sdpa", "eager"], default="auto",
+                        help="hf engine attention kernel; auto uses FlashAttention-2 when "
+                             "flash-attn is installed and weights are fp16/bf16, else SDPA")
+    args = parser.parse_args(argv)
+    if args.use_4bit and args.quant == "none":
+        args.quant = "bnb4"
+    if args.assistant_model:
+        # Assisted generation verifies draft tokens one sequence at a time
+        if args.engine != "hf" or args.batch_size != 1 or args.compile:
+            parser.error("--assistant_model needs --engine hf, --batch_size 1 and no --compile")
+    return args
 
 
 def load_eval_file(path: Path) -> List[Dict[str, Any]]:
     """Load evaluation benchmark JSONL."""
     items: List[Dict[str, Any]] = []
-    with path.open("r", encoding="utf-8") as f:
+    with path.open("rb", buffering=JSONL_BUFFER_SIZE) as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            if not line.strip():
                 continue
             try:
-                items.append(json.loads(line))
+                items.append(_json_loads(line))
             except json.JSONDecodeError:
                 continue
     return items
@@ -127,38 +198,53 @@ def build_messages(item: Dict[str, Any], system_prompt: str) -> List[Dict[str, s
     ]
 
 
-def format_prompt(tokenizer, messages: List[Dict[str, str]]) -> str:
-    """Convert messages to model prompt string."""
+def format_prompts(tokenizer, conversations: List[List[Dict[str, str]]]) -> List[str]:
+    """Convert message lists to model prompt strings in one chat-template call."""
     if hasattr(tokenizer, "apply_chat_template") and getattr(tokenizer, "chat_template", None):
         return tokenizer.apply_chat_template(
-            messages,
+            conversations,
             tokenize=False,
             add_generation_prompt=True,
         )
-    return "\n".join([f"<{m['role']}>\n{m['content']}" for m in messages])
+    return [
+        "\n".join([f"<{m['role']}>\n{m['content']}" for m in messages])
+        for messages in conversations
+    ]
+
+
+REFUSAL_KEYWORDS = ("无法", "不能", "不足", "缺少", "需要更多", "超出", "不确定", "资料不足")
+
+
+def _build_refusal_automaton() -> Any:
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for keyword in REFUSAL_KEYWORDS:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+
+_REFUSAL_AC = _build_refusal_automaton()
 
 
 def detect_refusal(response: str) -> bool:
     """Detect if response is a refusal."""
-    keywords = ["无法", "不能", "不足", "缺少", "需要更多", "超出", "不确定", "资料不足"]
-    return any(k in response for k in keywords)
+    if _REFUSAL_AC is not None:
+        # One pass over the response, stopping at the first keyword hit
+        return next(_REFUSAL_AC.iter(response), None) is not None
+    return any(k in response for k in REFUSAL_KEYWORDS)
 
 
 def extract_tool_calls(response: str) -> List[str]:
     """Extract tool call names from response (basic pattern matching)."""
-    import re
-    patterns = [
-        r"<tool_calls>(.*?)</tool_calls>",
-        r'"function":\s*\{\s*"name":\s*"([^"]+)"',
-        r"调用(?:工具|函数)[:：]\s*(\w+)",
-    ]
     tools: List[str] = []
-    for pattern in patterns:
-        matches = re.findall(pattern, response, re.DOTALL)
+    for pattern in _TOOL_PATTERNS:
+        matches = pattern.findall(response)
         for m in matches:
             if isinstance(m, str) and m.strip():
                 if "function" in m or "{" in m:
-                    name_match = re.search(r'"name":\s*"([^"]+)"', m)
+                    name_match = _NAME_RE.search(m)
                     if name_match:
                         tools.append(name_match.group(1))
                 else:
@@ -168,15 +254,40 @@ def extract_tool_calls(response: str) -> List[str]:
 
 def extract_citations(response: str) -> List[str]:
     """Extract citation markers from response."""
-    import re
-    matches = re.findall(r"\[([^\]]+)\]", response)
-    results: List[str] = []
-    for m in matches:
-        for token in re.split(r"[,\s]+", m):
-            token = token.strip()
-            if token and not token.startswith("#"):
-                results.append(token)
-    return results
+    return [
+        token
+        for group in _CITE_RE.findall(response)
+        for token in _CITE_TOKEN_RE.findall(group)
+    ]
+
+
+def length_bucket(length: int) -> int:
+    """Smallest power of two that fits a prompt of `length` tokens."""
+    return 1 << max(length - 1, 0).bit_length()
+
+
+def plan_batches(
+    tokenizer,
+    prompts: List[str],
+    batch_size: int,
+    bucketed: bool = False,
+) -> Iterator[Tuple[List[int], Optional[int]]]:
+    """Yield (prompt indices, pad width) batches ordered by token length.
+
+    Sorting keeps each batch close to its own longest prompt. With `bucketed`,
+    a batch never spans two power-of-two length buckets and is padded to its
+    bucket, so a compiled model only ever sees a handful of input shapes.
+    """
+    lengths = [len(ids) for ids in tokenizer(prompts)["input_ids"]]
+    order = sorted(range(len(prompts)), key=lengths.__getitem__)
+    if not bucketed:
+        for start_idx in range(0, len(order), batch_size):
+            yield order[start_idx: start_idx + batch_size], None
+        return
+    for bucket, group in groupby(order, key=lambda i: length_bucket(lengths[i])):
+        indices = list(group)
+        for start_idx in range(0, len(indices), batch_size):
+            yield indices[start_idx: start_idx + batch_size], bucket
 
 
 def generate_batch(
@@ -186,18 +297,25 @@ def generate_batch(
     max_new_tokens: int,
     temperature: float,
     top_p: float,
+    pad_to: Optional[int] = None,
+    assistant_model=None,
 ) -> List[str]:
-    """Generate responses for a batch of prompts."""
+    """Generate responses for a batch of prompts, optionally padded to a fixed width."""
+    generate_kwargs: Dict[str, Any] = {}
+    if assistant_model is not None:
+        generate_kwargs["assistant_model"] = assistant_model
     encoded = tokenizer(
         prompts,
         return_tensors="pt",
-        padding=True,
+        padding="max_length" if pad_to else True,
+        max_length=pad_to,
         truncation=True,
     )
     encoded = {k: v.to(model.device) for k, v in encoded.items()}
-    input_lengths = encoded["attention_mask"].sum(dim=1)
+    # Left padding: every row's generated tokens start at the padded input width
+    input_width = encoded["input_ids"].shape[1]
 
-    with torch.no_grad():
+    with torch.inference_mode():
         outputs = model.generate(
             **encoded,
             max_new_tokens=max_new_tokens,
@@ -205,40 +323,193 @@ def generate_batch(
             top_p=top_p,
             do_sample=temperature > 0,
             pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+            **generate_kwargs,
         )
 
-    responses: List[str] = []
-    for i, output in enumerate(outputs):
-        start = int(input_lengths[i].item())
-        generated_ids = output[start:]
-        response = tokenizer.decode(generated_ids, skip_special_tokens=True)
-        responses.append(response.strip())
-    return responses
+    # One slice for the whole batch; no per-row lengths or device syncs
+    generated = outputs[:, input_width:]
+    return [
+        response.strip()
+        for response in tokenizer.batch_decode(generated, skip_special_tokens=True)
+    ]
 
 
-def main() -> None:
-    args = parse_args()
+# --quant choice -> vLLM quantization method
+VLLM_QUANTIZATION = {"bnb4": "bitsandbytes", "gptq": "gptq", "awq": "awq"}
 
-    eval_path = Path(args.eval_file)
-    if not eval_path.exists():
-        raise FileNotFoundError(f"Eval file not found: {eval_path}")
 
-    adapter_path = Path(args.adapter_path)
-    if not adapter_path.exists():
-        raise FileNotFoundError(f"Adapter path not found: {adapter_path}")
+def init_tensor_parallel() -> None:
+    """Join the torchrun process group for --tensor_parallel.
 
-    eval_data = load_eval_file(eval_path)
-    if args.limit > 0:
-        eval_data = eval_data[: args.limit]
+    Launch with ``torchrun --nproc-per-node N ... --tensor_parallel`` to shard
+    matmuls across N GPUs.
+    """
+    if int(os.environ.get("WORLD_SIZE", "1")) < 2:
+        raise SystemExit(
+            "--tensor_parallel needs a multi-process launch: torchrun --nproc-per-node N"
+        )
+    if not torch.distributed.is_initialized():
+        local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+        torch.cuda.set_device(local_rank)
+        torch.distributed.init_process_group(
+            "nccl", device_id=torch.device(f"cuda:{local_rank}")
+        )
 
-    if not eval_data:
-        raise ValueError("No valid eval samples found in eval_file")
 
-    model_kwargs: Dict[str, Any] = {
-        "device_map": "auto",
+def broadcast_seed(seed: int) -> int:
+    """Return a seed shared by every tensor-parallel rank: ``seed``, or one drawn on rank 0."""
+    if seed <= 0:
+        shared = torch.randint(1, 2**31 - 1, (1,), device="cuda")
+        torch.distributed.broadcast(shared, src=0)
+        seed = int(shared.item())
+    return seed
+
+
+def is_main_process() -> bool:
+    return int(os.environ.get("RANK", "0")) == 0
+
+
+def adapter_rank(adapter_path: Path) -> int:
+    """Read the LoRA rank from adapter_config.json (vLLM needs it up front)."""
+    config_path = adapter_path / "adapter_config.json"
+    if config_path.exists():
+        config = json.loads(config_path.read_text(encoding="utf-8"))
+        return int(config.get("r", 16))
+    return 16
+
+
+def generate_vllm(args: argparse.Namespace, prompts: List[str]) -> List[str]:
+    """Generate all prompts with vLLM; scheduling/batching happens inside the engine."""
+    try:
+        from vllm import LLM, SamplingParams
+        from vllm.lora.request import LoRARequest
+    except ImportError as exc:
+        raise SystemExit("Missing dependency: vllm. Install with: pip install vllm") from exc
+
+    llm_kwargs: Dict[str, Any] = {
+        "model": args.model_name_or_path,
         "trust_remote_code": True,
+        "dtype": "bfloat16" if args.bf16 else "auto",
+        "enable_lora": True,
+        "max_lora_rank": adapter_rank(Path(args.adapter_path)),
+    }
+    if args.quant != "none":
+        llm_kwargs["quantization"] = VLLM_QUANTIZATION[args.quant]
+    if args.seed > 0:
+        llm_kwargs["seed"] = args.seed
+    llm = LLM(**llm_kwargs)
+
+    sampling_params = SamplingParams(
+        temperature=args.temperature,
+        top_p=args.top_p if args.temperature > 0 else 1.0,
+        max_tokens=args.max_new_tokens,
+    )
+    lora_request = LoRARequest("adapter", 1, str(Path(args.adapter_path).resolve()))
+    outputs = llm.generate(prompts, sampling_params, lora_request=lora_request)
+    return [output.outputs[0].text.strip() for output in outputs]
+
+
+def build_prediction(item: Dict[str, Any], index: int, response: str) -> Dict[str, Any]:
+    return {
+        "id": item.get("id") or f"sample-{index}",
+        "response": response,
+        "citations": extract_citations(response),
+        "tool_calls": extract_tool_calls(response),
+        "refused": detect_refusal(response),
     }
-    if args.use_4bit:
+
+
+def compile_for_inference(model):
+    """Merge LoRA weights and compile a graph-stable forward for generate()."""
+    # The PEFT wrapper swaps tensors per call, which breaks Dynamo graphs
+    if isinstance(model, PeftModel):
+        model = model.merge_and_unload()
+    # Fixed-shape KV cache lets decode steps replay one captured CUDA graph
+    model.generation_config.cache_implementation = "static"
+    model.forward = torch.compile(model.forward, mode="reduce-overhead", fullgraph=False)
+    return model
+
+
+def resolve_attn_implementation(choice: str, model_kwargs: Dict[str, Any]) -> str:
+    """Pick the attention kernel; "auto" prefers FlashAttention-2 when it can run."""
+    half_precision = model_kwargs.get("torch_dtype") in (torch.float16, torch.bfloat16)
+    has_flash_attn = importlib.util.find_spec("flash_attn") is not None
+    if choice == "auto":
+        return "flash_attention_2" if has_flash_attn and half_precision else "sdpa"
+    if choice == "flash_attention_2":
+        if not has_flash_attn:
+            raise SystemExit(
+                "Missing dependency: flash-attn. "
+                "Install with: pip install flash-attn --no-build-isolation"
+            )
+        if not half_precision:
+            raise SystemExit("flash_attention_2 needs fp16/bf16 weights: pass --bf16 or --quant")
+    return choice
+
+
+MERGED_SOURCE_FILE = "merged_from.json"
+ADAPTER_FILES = ("adapter_config.json", "adapter_model.safetensors", "adapter_model.bin")
+
+
+def adapter_fingerprint(args: argparse.Namespace) -> Dict[str, str]:
+    """Identify the base model and adapter weights a merged cache is built from."""
+    adapter_path = Path(args.adapter_path).resolve()
+    digest = hashlib.sha256()
+    for name in ADAPTER_FILES:
+        path = adapter_path / name
+        if not path.exists():
+            continue
+        digest.update(name.encode("utf-8"))
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return {
+        "model_name_or_path": args.model_name_or_path,
+        "adapter_path": str(adapter_path),
+        "adapter_sha256": digest.hexdigest(),
+    }
+
+
+def merged_cache_matches(merged_dir: Path, fingerprint: Dict[str, str]) -> bool:
+    """True when merged_dir holds weights merged from exactly this base model and adapter."""
+    if not (merged_dir / "config.json").exists():
+        return False
+    try:
+        recorded = json.loads((merged_dir / MERGED_SOURCE_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return False
+    return recorded == fingerprint
+
+
+def load_hf_model(args: argparse.Namespace, tokenizer):
+    """Load the base model with the adapter applied (or the merged cache) for generation."""
+    merged_dir = Path(args.merged_cache) if args.merged_cache else None
+    fingerprint = adapter_fingerprint(args) if merged_dir is not None else {}
+    use_merged = merged_dir is not None and merged_cache_matches(merged_dir, fingerprint)
+    if merged_dir is not None and not use_merged and (merged_dir / "config.json").exists():
+        print(f"Merged cache {merged_dir} was built from a different model or adapter; rebuilding")
+
+    model_kwargs: Dict[str, Any] = {"trust_remote_code": True}
+    if args.tensor_parallel and not use_merged:
+        # PEFT cannot wrap a model that tp_plan has already sharded
+        raise SystemExit(
+            "--tensor_parallel needs merged weights: build --merged_cache once without it "
+            "(with --quant none), then pass the same --merged_cache here"
+        )
+    if merged_dir is not None and not use_merged and args.quant != "none":
+        raise SystemExit("--merged_cache must be built once with --quant none")
+    if args.tensor_parallel:
+        if args.quant == "bnb4":
+            raise SystemExit("--quant bnb4 is not supported with tensor parallelism")
+        init_tensor_parallel()
+        model_kwargs["tp_plan"] = "auto"
+        # Every rank must draw the same samples or the sharded decode diverges
+        torch.manual_seed(broadcast_seed(args.seed))
+    else:
+        model_kwargs["device_map"] = "auto"
+    if args.compile and args.quant != "none":
+        raise SystemExit("--compile needs full-precision weights to merge the adapter into")
+    if args.quant == "bnb4":
         try:
             import bitsandbytes as _  # noqa: F401
         except ImportError as exc:
@@ -253,54 +524,189 @@ def main() -> None:
             "bnb_4bit_compute_dtype": compute_dtype,
             "torch_dtype": compute_dtype,
         })
+    elif args.quant == "gptq":
+        from transformers import GPTQConfig
+
+        # int4 weights / fp16 activations via the exllama kernels
+        model_kwargs.update({
+            "quantization_config": GPTQConfig(bits=4, use_exllama=True),
+            "torch_dtype": torch.float16,
+        })
+    elif args.quant == "awq":
+        try:
+            import awq as _  # noqa: F401
+        except ImportError as exc:
+            raise SystemExit(
+                "Missing dependency: autoawq. Install with: pip install autoawq"
+            ) from exc
+        # The AWQ checkpoint carries its own quantization_config
+        model_kwargs["torch_dtype"] = torch.float16
     elif args.bf16:
         model_kwargs["torch_dtype"] = torch.bfloat16
 
-    print(f"Loading model from {args.model_name_or_path}...")
-    tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, trust_remote_code=True)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"  # decoder-only generation continues from the right edge
 
-    model = AutoModelForCausalLM.from_pretrained(args.model_name_or_path, **model_kwargs)
-
-    print(f"Loading adapter from {args.adapter_path}...")
-    model = PeftModel.from_pretrained(model, args.adapter_path)
+    model_kwargs["attn_implementation"] = resolve_attn_implementation(
+        args.attn_implementation, model_kwargs
+    )
+    if use_merged:
+        # Adapter already folded into the weights by an earlier run
+        print(f"Loading merged model from {merged_dir}...")
+        model = AutoModelForCausalLM.from_pretrained(merged_dir, **model_kwargs)
+    else:
+        print(f"Loading model from {args.model_name_or_path}...")
+        model = AutoModelForCausalLM.from_pretrained(args.model_name_or_path, **model_kwargs)
+
+        print(f"Loading adapter from {args.adapter_path}...")
+        model = PeftModel.from_pretrained(model, args.adapter_path)
+        if merged_dir is not None:
+            model = model.merge_and_unload()
+            print(f"Saving merged model to {merged_dir}...")
+            model.save_pretrained(merged_dir)
+            tokenizer.save_pretrained(merged_dir)
+            # Written last so an interrupted save is never mistaken for a valid cache
+            (merged_dir / MERGED_SOURCE_FILE).write_text(
+                json.dumps(fingerprint, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
     model.eval()
+    if args.compile:
+        model = compile_for_inference(model)
+    return model
+
 
-    predictions: List[Dict[str, Any]] = []
-    total = len(eval_data)
+def generate_hf(
+    args: argparse.Namespace,
+    model,
+    tokenizer,
+    prompts: List[str],
+) -> Iterator[Tuple[int, str]]:
+    """Yield (prompt index, response) with transformers + PEFT as each padded batch finishes."""
+    assistant = None
+    if args.assistant_model:
+        print(f"Loading assistant model from {args.assistant_model}...")
+        assistant = AutoModelForCausalLM.from_pretrained(
+            args.assistant_model, torch_dtype=model.dtype, trust_remote_code=True
+        ).to(model.device)
+        assistant.eval()
+
+    total = len(prompts)
     print(f"Generating predictions for {total} samples with batch size {args.batch_size}...")
 
-    for start_idx in range(0, total, args.batch_size):
-        batch_items = eval_data[start_idx: start_idx + args.batch_size]
-        batch_messages = [build_messages(item, args.system_prompt) for item in batch_items]
-        batch_prompts = [format_prompt(tokenizer, msgs) for msgs in batch_messages]
+    # Compiled graphs are keyed on input shape, so pad to length buckets
+    batches = plan_batches(tokenizer, prompts, args.batch_size, bucketed=args.compile)
+    for batch_indices, pad_to in batches:
         batch_responses = generate_batch(
             model,
             tokenizer,
-            batch_prompts,
+            [prompts[i] for i in batch_indices],
             args.max_new_tokens,
             args.temperature,
             args.top_p,
+            pad_to=pad_to,
+            assistant_model=assistant,
         )
+        yield from zip(batch_indices, batch_responses)
 
-        for idx, (item, response) in enumerate(zip(batch_items, batch_responses)):
-            item_id = item.get("id") or f"sample-{start_idx + idx}"
-            predictions.append({
-                "id": item_id,
-                "response": response,
-                "citations": extract_citations(response),
-                "tool_calls": extract_tool_calls(response),
-                "refused": detect_refusal(response),
-            })
 
-    output_path = Path(args.output)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as f:
-        for pred in predictions:
-            f.write(json.dumps(pred, ensure_ascii=False) + "\n")
+def generate_pipeline(
+    args: argparse.Namespace,
+    model,
+    tokenizer,
+    prompts: List[str],
+) -> Iterator[Tuple[int, str]]:
+    """Yield (prompt index, response) from a text-generation pipeline over a Dataset.
+
+    The pipeline's DataLoader tokenizes the next batches while the current one decodes.
+    """
+    try:
+        from datasets import Dataset
+        from transformers import pipeline
+        from transformers.pipelines.pt_utils import KeyDataset
+    except ImportError as exc:
+        raise SystemExit("Missing dependency: datasets. Install with: pip install datasets") from exc
+
+    # Feed prompts in length order so each pipeline batch pads to a similar width
+    order = [
+        idx
+        for batch_indices, _ in plan_batches(tokenizer, prompts, args.batch_size)
+        for idx in batch_indices
+    ]
+    dataset = Dataset.from_dict({"prompt": [prompts[i] for i in order]})
+    generator = pipeline("text-generation", model=model, tokenizer=tokenizer)
+    print(f"Generating predictions for {len(prompts)} samples with the text-generation pipeline...")
+
+    outputs = generator(
+        KeyDataset(dataset, "prompt"),
+        batch_size=args.batch_size,
+        max_new_tokens=args.max_new_tokens,
+        temperature=args.temperature,
+        top_p=args.top_p,
+        do_sample=args.temperature > 0,
+        pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
+        return_full_text=False,
+    )
+    for idx, output in zip(order, outputs):
+        yield idx, output[0]["generated_text"].strip()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
+    if args.seed > 0:
+        torch.manual_seed(args.seed)
+
+    eval_path = Path(args.eval_file)
+    if not eval_path.exists():
+        raise FileNotFoundError(f"Eval file not found: {eval_path}")
+
+    adapter_path = Path(args.adapter_path)
+    if not adapter_path.exists():
+        raise FileNotFoundError(f"Adapter path not found: {adapter_path}")
+
+    eval_data = load_eval_file(eval_path)
+    if args.limit > 0:
+        eval_data = eval_data[: args.limit]
+
+    if not eval_data:
+        raise ValueError("No valid eval samples found in eval_file")
+
+    print(f"Loading tokenizer from {args.model_name_or_path}...")
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, trust_remote_code=True)
+    # Render every chat template before any GPU work starts
+    prompts = format_prompts(
+        tokenizer, [build_messages(item, args.system_prompt) for item in eval_data]
+    )
 
-    print(f"Written {len(predictions)} predictions to: {output_path}")
+    completed: Iterator[Tuple[int, str]]
+    if args.engine == "vllm":
+        print(f"Generating predictions for {len(prompts)} samples with vLLM...")
+        completed = enumerate(generate_vllm(args, prompts))
+    else:
+        model = load_hf_model(args, tokenizer)
+        if args.engine == "pipeline":
+            completed = generate_pipeline(args, model, tokenizer, prompts)
+        else:
+            completed = generate_hf(args, model, tokenizer, prompts)
+
+    main_process = is_main_process()
+    output_path = Path(args.output)
+    if main_process:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Other tensor-parallel ranks run the same generation but discard the output
+    sink = output_path if main_process else Path(os.devnull)
+
+    # Predictions are written as batches finish (length-sorted, so not in input
+    # order); eval_metrics joins them back to the benchmark by id.
+    written = 0
+    with sink.open("wb", buffering=JSONL_BUFFER_SIZE) as f:
+        for idx, response in completed:
+            f.write(dumps_line(build_prediction(eval_data[idx], idx, response)))
+            written += 1
+
+    if main_process:
+        print(f"Written {written} predictions to: {output_path}")
 
 
 if __name__ == "__main__":
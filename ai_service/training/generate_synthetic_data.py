@@ -16,14 +16,30 @@ Input file format (topics.txt):
 from __future__ import annotations
 
 import argparse
+import importlib.util
 import json
+import os
 import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import torch
 from transformers import AutoModelForCausalLM, AutoTokenizer
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+JSONL_BUFFER_SIZE = 1 << 16
+
+
+def dumps_line(obj: Any) -> bytes:
+    """Serialize one JSONL record, newline included."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
 
 DEFAULT_SYSTEM_PROMPT = "你是一个通用的智能教学助手。"
 TOOL_SYSTEM_PROMPT = "你是通用教学平台的 AI 助教，擅长使用工具。"
@@ -71,21 +87,97 @@ def parse_args() -> argparse.Namespace:
                         help="Sampling temperature")
     parser.add_argument("--top_p", type=float, default=0.9,
                         help="Top-p sampling parameter")
-    parser.add_argument("--use_4bit", action="store_true", help="Use 4-bit quantization")
+    parser.add_argument("--quant", type=str, choices=["none", "bnb4", "gptq", "awq"],
+                        default="none",
+                        help="Weight quantization: gptq/awq load a pre-quantized int4 "
+                             "checkpoint with fused inference kernels; bnb4 is NF4")
+    parser.add_argument("--use_4bit", action="store_true",
+                        help="Deprecated alias for --quant bnb4")
     parser.add_argument("--bf16", action="store_true", help="Use bfloat16")
     parser.add_argument("--system_prompt", type=str, default="",
                         help="Override system prompt (optional)")
     parser.add_argument("--seed", type=int, default=0,
                         help="Random seed (0 = no seed)")
-    return parser.parse_args()
+    parser.add_argument("--tensor_parallel", action="store_true",
+                        help="hf engine: shard the model across GPUs with tp_plan=\"auto\"; "
+                             "launch with torchrun --nproc-per-node N")
+    parser.add_argument("--engine", type=str, choices=["hf", "vllm"], default="hf",
+                        help="Generation backend: hf (transformers generate) or "
+                             "vllm (continuous batching)")
+    parser.add_argument("--attn_implementation", type=str,
+                        choices=["auto", "flash_attention_2", "sdpa", "eager"], default="auto",
+                        help="hf engine attention kernel; auto uses FlashAttention-2 when "
+                             "flash-attn is installed and weights are fp16/bf16, else SDPA")
+    args = parser.parse_args()
+    if args.use_4bit and args.quant == "none":
+        args.quant = "bnb4"
+    return args
+
+
+# --quant choice -> vLLM quantization method
+VLLM_QUANTIZATION = {"bnb4": "bitsandbytes", "gptq": "gptq", "awq": "awq"}
+
+
+def init_tensor_parallel() -> None:
+    """Join the torchrun process group for --tensor_parallel.
+
+    Launch with ``torchrun --nproc-per-node N ... --tensor_parallel`` to shard
+    matmuls across N GPUs.
+    """
+    if int(os.environ.get("WORLD_SIZE", "1")) < 2:
+        raise SystemExit(
+            "--tensor_parallel needs a multi-process launch: torchrun --nproc-per-node N"
+        )
+    if not torch.distributed.is_initialized():
+        local_rank = int(os.environ.get("LOCAL_RANK", "0"))
+        torch.cuda.set_device(local_rank)
+        torch.distributed.init_process_group(
+            "nccl", device_id=torch.device(f"cuda:{local_rank}")
+        )
+
+
+def broadcast_seed(seed: int) -> int:
+    """Return a seed shared by every tensor-parallel rank: ``seed``, or one drawn on rank 0."""
+    if seed <= 0:
+        shared = torch.randint(1, 2**31 - 1, (1,), device="cuda")
+        torch.distributed.broadcast(shared, src=0)
+        seed = int(shared.item())
+    return seed
+
+
+def is_main_process() -> bool:
+    return int(os.environ.get("RANK", "0")) == 0
+
+
+def resolve_attn_implementation(choice: str, model_kwargs: Dict[str, Any]) -> str:
+    """Pick the attention kernel; "auto" prefers FlashAttention-2 when it can run."""
+    half_precision = model_kwargs.get("torch_dtype") in (torch.float16, torch.bfloat16)
+    has_flash_attn = importlib.util.find_spec("flash_attn") is not None
+    if choice == "auto":
+        return "flash_attention_2" if has_flash_attn and half_precision else "sdpa"
+    if choice == "flash_attention_2":
+        if not has_flash_attn:
+            raise SystemExit(
+                "Missing dependency: flash-attn. "
+                "Install with: pip install flash-attn --no-build-isolation"
+            )
+        if not half_precision:
+            raise SystemExit("flash_attention_2 needs fp16/bf16 weights: pass --bf16 or --quant")
+    return choice
 
 
 def load_model(args):
-    model_kwargs: Dict[str, Any] = {
-        "device_map": "auto",
-        "trust_remote_code": True,
-    }
-    if args.use_4bit:
+    model_kwargs: Dict[str, Any] = {"trust_remote_code": True}
+    if args.tensor_parallel:
+        if args.quant == "bnb4":
+            raise SystemExit("--quant bnb4 is not supported with tensor parallelism")
+        init_tensor_parallel()
+        model_kwargs["tp_plan"] = "auto"
+        # Every rank must draw the same samples or the sharded decode diverges
+        torch.manual_seed(broadcast_seed(args.seed))
+    else:
+        model_kwargs["device_map"] = "auto"
+    if args.quant == "bnb4":
         try:
             import bitsandbytes as _  # noqa: F401
         except ImportError as exc:
@@ -100,10 +192,30 @@ def load_model(args):
             "bnb_4bit_compute_dtype": compute_dtype,
             "torch_dtype": compute_dtype,
         })
+    elif args.quant == "gptq":
+        from transformers import GPTQConfig
+
+        # int4 weights / fp16 activations via the exllama kernels
+        model_kwargs.update({
+            "quantization_config": GPTQConfig(bits=4, use_exllama=True),
+            "torch_dtype": torch.float16,
+        })
+    elif args.quant == "awq":
+        try:
+            import awq as _  # noqa: F401
+        except ImportError as exc:
+            raise SystemExit(
+                "Missing dependency: autoawq. Install with: pip install autoawq"
+            ) from exc
+        # The AWQ checkpoint carries its own quantization_config
+        model_kwargs["torch_dtype"] = torch.float16
     elif args.bf16:
         model_kwargs["torch_dtype"] = torch.bfloat16
 
     tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, trust_remote_code=True)
+    model_kwargs["attn_implementation"] = resolve_attn_implementation(
+        args.attn_implementation, model_kwargs
+    )
     model = AutoModelForCausalLM.from_pretrained(args.model_name_or_path, **model_kwargs)
     return model, tokenizer
 
@@ -133,9 +245,10 @@ def generate_batch(
 ) -> List[str]:
     inputs = tokenizer(prompts, return_tensors="pt", padding=True, truncation=True)
     inputs = {k: v.to(model.device) for k, v in inputs.items()}
-    input_lengths = inputs["attention_mask"].sum(dim=1)
+    # Left padding: every row's generated tokens start at the padded input width
+    input_width = inputs["input_ids"].shape[1]
 
-    with torch.no_grad():
+    with torch.inference_mode():
         outputs = model.generate(
             **inputs,
             max_new_tokens=max_new_tokens,
@@ -145,20 +258,104 @@ def generate_batch(
             pad_token_id=tokenizer.pad_token_id or tokenizer.eos_token_id,
         )
 
-    results: List[str] = []
-    for i, output in enumerate(outputs):
-        start = int(input_lengths[i].item())
-        generated = tokenizer.decode(output[start:], skip_special_tokens=True)
-        results.append(generated.strip())
-    return results
+    # One slice for the whole batch; no per-row lengths or device syncs
+    generated_ids = outputs[:, input_width:]
+    return [
+        generated.strip()
+        for generated in tokenizer.batch_decode(generated_ids, skip_special_tokens=True)
+    ]
+
+
+def generate_vllm(args: argparse.Namespace, prompts: List[str]) -> List[str]:
+    """Sample args.num_samples outputs per prompt with vLLM, flattened prompt-major.
+
+    Scheduling/batching happens inside the engine; the n samples of a prompt
+    share one prefill, and prefix caching reuses the common system scaffold.
+    """
+    try:
+        from vllm import LLM, SamplingParams
+    except ImportError as exc:
+        raise SystemExit("Missing dependency: vllm. Install with: pip install vllm") from exc
+
+    llm_kwargs: Dict[str, Any] = {
+        "model": args.model_name_or_path,
+        "trust_remote_code": True,
+        "dtype": "bfloat16" if args.bf16 else "auto",
+        "enable_prefix_caching": True,
+    }
+    if args.quant != "none":
+        llm_kwargs["quantization"] = VLLM_QUANTIZATION[args.quant]
+    if args.seed > 0:
+        llm_kwargs["seed"] = args.seed
+    llm = LLM(**llm_kwargs)
+
+    sampling_params = SamplingParams(
+        n=args.num_samples,
+        temperature=args.temperature,
+        top_p=args.top_p if args.temperature > 0 else 1.0,
+        max_tokens=args.max_new_tokens,
+    )
+    outputs = llm.generate(prompts, sampling_params)
+    return [
+        completion.text.strip()
+        for output in outputs
+        for completion in output.outputs
+    ]
+
+
+def sort_by_length(tokenizer, prompts: List[str]) -> List[int]:
+    """Prompt indices ordered by token length so each batch pads to a similar width."""
+    lengths = [len(ids) for ids in tokenizer(prompts, add_special_tokens=False)["input_ids"]]
+    return sorted(range(len(prompts)), key=lengths.__getitem__)
+
+
+def iter_hf_outputs(
+    args: argparse.Namespace,
+    model,
+    tokenizer,
+    prompts: List[str],
+) -> Iterator[Tuple[int, str]]:
+    """Yield (prompt index, output) as each length-sorted batch finishes."""
+    order = sort_by_length(tokenizer, prompts)
+    for start_idx in range(0, len(prompts), args.batch_size):
+        batch_indices = order[start_idx: start_idx + args.batch_size]
+        batch_outputs = generate_batch(
+            model,
+            tokenizer,
+            [prompts[i] for i in batch_indices],
+            args.max_new_tokens,
+            args.temperature,
+            args.top_p,
+        )
+        yield from zip(batch_indices, batch_outputs)
 
 
 def extract_json_block(text: str) -> Optional[str]:
-    start = text.find("{")
-    end = text.rfind("}")
-    if start == -1 or end == -1 or end <= start:
-        return None
-    return text[start:end + 1]
+    """Return the first balanced {...} block; braces inside JSON strings are ignored."""
+    depth = 0
+    start = -1
+    in_string = False
+    escaped = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            # Quotes only open strings inside an object; prose around it is skipped
+            in_string = depth > 0
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return None
 
 
 def parse_output(
@@ -243,45 +440,54 @@ def main() -> None:
     )
 
     print(f"[INFO] Loaded {len(topics)} topics")
-    model, tokenizer = load_model(args)
-    if tokenizer.pad_token is None:
-        tokenizer.pad_token = tokenizer.eos_token
-
-    tasks: List[Dict[str, Any]] = []
-    for topic in topics:
-        for _ in range(args.num_samples):
-            prompt = build_prompt(tokenizer, base_system, topic, args.mode)
-            tasks.append({"topic": topic, "prompt": prompt})
-
-    results: List[Dict[str, Any]] = []
-    total = len(tasks)
-    print(f"[INFO] Generating {total} samples (batch_size={args.batch_size})")
-
-    sample_index = 0
-    for start_idx in range(0, total, args.batch_size):
-        batch = tasks[start_idx: start_idx + args.batch_size]
-        prompts = [item["prompt"] for item in batch]
-        outputs = generate_batch(
-            model,
-            tokenizer,
-            prompts,
-            args.max_new_tokens,
-            args.temperature,
-            args.top_p,
-        )
-        for item, output in zip(batch, outputs):
-            sample = parse_output(output, args.mode, item["topic"], sample_index, base_system)
-            sample_index += 1
-            if sample:
-                results.append(sample)
+    if args.engine == "vllm":
+        tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, trust_remote_code=True)
+    else:
+        model, tokenizer = load_model(args)
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"  # decoder-only generation continues from the right edge
+
+    # Render each distinct topic's chat template once, before any GPU work starts;
+    # the num_samples copies of a topic share the same prompt string.
+    topic_prompts = {
+        topic: build_prompt(tokenizer, base_system, topic, args.mode)
+        for topic in dict.fromkeys(topics)
+    }
+    task_topics = [topic for topic in topics for _ in range(args.num_samples)]
+    prompts = [topic_prompts[topic] for topic in task_topics]
 
+    total = len(prompts)
+
+    completed: Iterator[Tuple[int, str]]
+    if args.engine == "vllm":
+        print(f"[INFO] Generating {total} samples with vLLM")
+        # One request per topic occurrence; n=num_samples expands it in task order
+        completed = enumerate(generate_vllm(args, [topic_prompts[topic] for topic in topics]))
+    else:
+        print(f"[INFO] Generating {total} samples (batch_size={args.batch_size})")
+        completed = iter_hf_outputs(args, model, tokenizer, prompts)
+
+    main_process = is_main_process()
     output_path = Path(args.output_file)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as f:
-        for item in results:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    if main_process:
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Other tensor-parallel ranks run the same generation but discard the output
+    sink = output_path if main_process else Path(os.devnull)
+
+    # Samples are written as batches finish; ids still carry the task index.
+    written = 0
+    with sink.open("wb", buffering=JSONL_BUFFER_SIZE) as f:
+        for sample_index, output in completed:
+            sample = parse_output(
+                output, args.mode, task_topics[sample_index], sample_index, base_system
+            )
+            if sample:
+                f.write(dumps_line(sample))
+                written += 1
 
-    print(f"[INFO] Generated {len(results)} samples saved to {args.output_file}")
+    if main_process:
+        print(f"[INFO] Generated {written} samples saved to {args.output_file}")
 
 
 if __name__ == "__main__":
@@ -7,15 +7,49 @@ Usage:
 
 from __future__ import annotations
 
-import argparse
-import json
+import mmap
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
 
+try:
+    import ujson
+except ImportError:  # pragma: no cover - optional speedup
+    ujson = None
+
+# Fastest available codec: orjson, then ujson, then the stdlib. Every decode
+# error is a ValueError (json/orjson/ujson decode errors, UnicodeDecodeError).
+if orjson is not None:
+    _json_loads = orjson.loads
+elif ujson is not None:
+    _json_loads = ujson.loads
+else:
+    from json import loads as _json_loads
+
+
+def _dumps_bytes(obj: Any) -> bytes:
+    # Every codec emits orjson's compact form (no spaces after "," and ":", raw
+    # UTF-8, unescaped "/") so a payload is byte-identical whichever is installed.
+    if orjson is not None:
+        return orjson.dumps(obj)
+    if ujson is not None:
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode("utf-8")
+    import json
+
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+@lru_cache(maxsize=1)
 def get_project_root() -> Path:
-    """Find project root by walking up from this file."""
+    """Find project root by walking up from this file (walked once per process)."""
     current = Path(__file__).resolve()
     for parent in current.parents:
         if (parent / "README.md").exists() and (parent / "code").exists():
@@ -31,6 +65,11 @@ TRAINING_DATA_DIRS = [
     "data/training/eval",
 ]
 
+# Deduplicated, shallowest first, so deeper makedirs calls find their parents in place
+_TRAINING_DATA_DIRS_BY_DEPTH = tuple(
+    sorted(dict.fromkeys(TRAINING_DATA_DIRS), key=lambda rel_path: rel_path.count("/"))
+)
+
 # System prompt for style generation
 SYSTEM_PROMPT = (
     "你是一个通用的智能教学助手。请根据以下知识点，生成一个教学对话样本。\n"
@@ -43,21 +82,25 @@ SYSTEM_PROMPT = (
 )
 
 
+# System message shared by every style SFT sample
+TUTOR_SYSTEM_PROMPT = (
+    "你是高校课程助教。请按以下结构回答：\n"
+    "### 结论\n"
+    "### 推导\n"
+    "### 检查（单位/边界条件/适用条件）"
+)
+
+# One dict shared by all style samples; the SAMPLE_* data is never mutated
+_TUTOR_SYSTEM_MESSAGE = {"role": "system", "content": TUTOR_SYSTEM_PROMPT}
+
+
 # Sample training data (style SFT)
 SAMPLE_STYLE_DATA: List[Dict[str, Any]] = [
     {
         "id": "style-sample-001",
         "mode": "tutor",
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "你是高校课程助教。请按以下结构回答：\n"
-                    "### 结论\n"
-                    "### 推导\n"
-                    "### 检查（单位/边界条件/适用条件）"
-                )
-            },
+            _TUTOR_SYSTEM_MESSAGE,
             {"role": "user", "content": "什么是课程中的边界条件概念？"},
             {
                 "role": "assistant",
@@ -78,15 +121,7 @@ SAMPLE_STYLE_DATA: List[Dict[str, Any]] = [
         "id": "style-sample-002",
         "mode": "tutor",
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "你是高校课程助教。请按以下结构回答：\n"
-                    "### 结论\n"
-                    "### 推导\n"
-                    "### 检查（单位/边界条件/适用条件）"
-                )
-            },
+            _TUTOR_SYSTEM_MESSAGE,
             {"role": "user", "content": "解释阈值效应的含义"},
             {
                 "role": "assistant",
@@ -107,15 +142,7 @@ SAMPLE_STYLE_DATA: List[Dict[str, Any]] = [
         "id": "style-sample-003",
         "mode": "tutor",
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "你是高校课程助教。请按以下结构回答：\n"
-                    "### 结论\n"
-                    "### 推导\n"
-                    "### 检查（单位/边界条件/适用条件）"
-                )
-            },
+            _TUTOR_SYSTEM_MESSAGE,
             {"role": "user", "content": "什么是核心概念 X？"},
             {
                 "role": "assistant",
@@ -136,15 +163,7 @@ SAMPLE_STYLE_DATA: List[Dict[str, Any]] = [
         "id": "style-sample-004",
         "mode": "tutor",
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "你是高校课程助教。请按以下结构回答：\n"
-                    "### 结论\n"
-                    "### 推导\n"
-                    "### 检查（单位/边界条件/适用条件）"
-                )
-            },
+            _TUTOR_SYSTEM_MESSAGE,
             {"role": "user", "content": "区分指标 A 与指标 B"},
             {
                 "role": "assistant",
@@ -165,15 +184,7 @@ SAMPLE_STYLE_DATA: List[Dict[str, Any]] = [
         "id": "style-sample-005",
         "mode": "tutor",
         "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "你是高校课程助教。请按以下结构回答：\n"
-                    "### 结论\n"
-                    "### 推导\n"
-                    "### 检查（单位/边界条件/适用条件）"
-                )
-            },
+            _TUTOR_SYSTEM_MESSAGE,
             {"role": "user", "content": "解释指标 C 的实际意义"},
             {
                 "role": "assistant",
@@ -323,58 +334,262 @@ SAMPLE_PREDICTIONS: List[Dict[str, Any]] = [
     }
 ]
 
+
+def serialize_jsonl(items: List[Dict[str, Any]]) -> bytes:
+    """Encode items as a complete JSONL payload (empty bytes for no items)."""
+    if not items:
+        return b""
+    return b"\n".join([_dumps_bytes(item) for item in items]) + b"\n"
+
+
+_SAMPLE_DATASETS: Dict[str, List[Dict[str, Any]]] = {
+    "style": SAMPLE_STYLE_DATA,
+    "benchmark": SAMPLE_BENCHMARK_DATA,
+    "predictions": SAMPLE_PREDICTIONS,
+}
+
+
+@lru_cache(maxsize=None)
+def _sample_payload(name: str) -> bytes:
+    """JSONL bytes for a built-in sample dataset, encoded on first use and then reused."""
+    # The sample datasets never change at runtime
+    return serialize_jsonl(_SAMPLE_DATASETS[name])
+
+
 def create_directories(root: Path, dry_run: bool = False) -> None:
     """Create training data directory structure."""
-    for rel_path in TRAINING_DATA_DIRS:
-        dir_path = root / rel_path
+    root_str = os.fspath(root)
+    for rel_path in _TRAINING_DATA_DIRS_BY_DEPTH:
+        dir_path = os.path.join(root_str, rel_path)
         if dry_run:
             print(f"[DRY-RUN] Would create: {dir_path}")
         else:
-            dir_path.mkdir(parents=True, exist_ok=True)
+            os.makedirs(dir_path, exist_ok=True)
             print(f"[OK] Created: {dir_path}")
 
 
-def write_jsonl(path: Path, items: List[Dict[str, Any]], overwrite: bool = False) -> bool:
-    """Write items to JSONL file. Returns True if written."""
+_print_lock = threading.Lock()
+
+
+def _log(message: str) -> None:
+    # Sample files are written from worker threads; keep each line whole
+    with _print_lock:
+        print(message)
+
+
+def _write_bytes(path: Path, data: bytes) -> None:
+    """Write an encoded payload straight to a raw fd, truncating any existing file."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            # os.write may accept only part of the buffer
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
+def write_jsonl(
+    path: Path,
+    items: List[Dict[str, Any]],
+    overwrite: bool = False,
+    preserialized: Optional[bytes] = None,
+    skip_mkdir: bool = False,
+) -> bool:
+    """Write items to JSONL file. Returns True if written.
+
+    `preserialized` is the already-encoded payload for `items`, written as-is.
+    `skip_mkdir` trusts the caller that the parent directory already exists.
+    """
     if path.exists() and not overwrite:
-        print(f"[SKIP] Already exists (use --overwrite to replace): {path}")
+        _log(f"[SKIP] Already exists (use --overwrite to replace): {path}")
         return False
     
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with path.open("w", encoding="utf-8") as f:
-        for item in items:
-            f.write(json.dumps(item, ensure_ascii=False) + "\n")
-    print(f"[OK] Written {len(items)} samples to: {path}")
+    if not skip_mkdir:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    # Serialize everything up front and hand the file a single buffer
+    payload = preserialized if preserialized is not None else serialize_jsonl(items)
+    _write_bytes(path, payload)
+    _log(f"[OK] Written {len(items)} samples to: {path}")
     return True
 
 
-def create_sample_data(root: Path, overwrite: bool = False) -> None:
-    """Create sample training and evaluation data."""
-    # Style SFT sample
-    write_jsonl(
-        root / "data/training/processed/style_sft_sample.jsonl",
-        SAMPLE_STYLE_DATA,
-        overwrite
-    )
-    
-    # Benchmark sample
-    write_jsonl(
-        root / "data/training/eval/benchmark_sample.jsonl",
-        SAMPLE_BENCHMARK_DATA,
-        overwrite
-    )
-    
-    # Predictions sample (for testing eval_metrics.py)
-    write_jsonl(
-        root / "data/training/eval/predictions_sample.jsonl",
-        SAMPLE_PREDICTIONS,
-        overwrite
-    )
+OUTPUT_FORMATS = ("jsonl", "arrow", "parquet")
+
+
+def write_columnar(
+    path: Path,
+    items: List[Dict[str, Any]],
+    output_format: str,
+    overwrite: bool = False,
+    skip_mkdir: bool = False,
+) -> bool:
+    """Write items as a zstd-compressed Arrow (Feather v2) or Parquet table.
+
+    Nested fields map to Arrow types directly (`messages` becomes
+    list<struct<role, content>>), so loaders can mmap the file without parsing.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise SystemExit("Missing dependency: pyarrow. Install with: pip install pyarrow") from exc
+
+    if path.exists() and not overwrite:
+        _log(f"[SKIP] Already exists (use --overwrite to replace): {path}")
+        return False
+
+    if not skip_mkdir:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pylist(items)
+    if output_format == "arrow":
+        feather.write_feather(table, path, compression="zstd")
+    else:
+        pq.write_table(table, path, compression="zstd", use_dictionary=True)
+    _log(f"[OK] Written {len(items)} samples to: {path}")
+    return True
+
+
+def create_sample_data(
+    root: Path,
+    overwrite: bool = False,
+    dirs_created: bool = False,
+    workers: int = 3,
+    output_format: str = "jsonl",
+) -> None:
+    """Create sample training and evaluation data.
+
+    Pass `dirs_created` when create_directories already ran for `root`. The files
+    are independent, so up to `workers` of them are written concurrently. With an
+    `arrow`/`parquet` format the files get that suffix instead of `.jsonl`.
+    """
+    samples = [
+        # Style SFT sample
+        (
+            root / "data/training/processed/style_sft_sample.jsonl",
+            "style",
+        ),
+        # Benchmark sample
+        (
+            root / "data/training/eval/benchmark_sample.jsonl",
+            "benchmark",
+        ),
+        # Predictions sample (for testing eval_metrics.py)
+        (
+            root / "data/training/eval/predictions_sample.jsonl",
+            "predictions",
+        ),
+    ]
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        if output_format == "jsonl":
+            futures = [
+                pool.submit(
+                    write_jsonl,
+                    path,
+                    _SAMPLE_DATASETS[name],
+                    overwrite,
+                    preserialized=_sample_payload(name),
+                    skip_mkdir=dirs_created,
+                )
+                for path, name in samples
+            ]
+        else:
+            futures = [
+                pool.submit(
+                    write_columnar,
+                    path.with_suffix(f".{output_format}"),
+                    _SAMPLE_DATASETS[name],
+                    output_format,
+                    overwrite,
+                    skip_mkdir=dirs_created,
+                )
+                for path, name in samples
+            ]
+        for future in as_completed(futures):
+            future.result()  # re-raise write errors
 
 # System prompt for style generation
 
 
-def validate_data_format(root: Path) -> int:
+JSONL_READ_CHUNK = 1 << 20
+
+
+def _iter_chunked_lines(f) -> Iterator[bytes]:
+    """Split a binary file on b"\n" reading 1MB at a time (used when mmap is unavailable)."""
+    carry = b""
+    while True:
+        chunk = f.read(JSONL_READ_CHUNK)
+        if not chunk:
+            break
+        lines = (carry + chunk).split(b"\n")
+        carry = lines.pop()
+        yield from lines
+    if carry:
+        yield carry
+
+
+def _iter_mmap_lines(mm: mmap.mmap) -> Iterator[bytes]:
+    start = 0
+    size = len(mm)
+    while start < size:
+        end = mm.find(b"\n", start)
+        if end == -1:
+            end = size
+        yield mm[start:end]
+        start = end + 1
+
+
+def iter_jsonl_lines(path: Path) -> Iterator[Tuple[int, bytes]]:
+    """Yield (line number, stripped bytes) for each non-blank line of a JSONL file."""
+    # Byte-level splitting: the parser gets raw bytes, no per-line decoding
+    with path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            # Some network/FUSE filesystems refuse mmap
+            mm = None
+        if mm is None:
+            lines = _iter_chunked_lines(f)
+        else:
+            lines = _iter_mmap_lines(mm)
+        try:
+            for lineno, line in enumerate(lines, 1):
+                line = line.strip()
+                if line:
+                    yield lineno, line
+        finally:
+            if mm is not None:
+                mm.close()
+
+
+def _validate_file(jsonl_file: Path, quick: bool = False) -> List[str]:
+    """Validate one JSONL file; returns one message per problem found.
+
+    With `quick`, lines whose bytes contain both the "id" and "messages" keys are
+    accepted without parsing. That skips the dict build for well-formed lines but
+    can miss malformed JSON, so it is opt-in.
+    """
+    problems: List[str] = []
+    # By default every line gets a full (native, via orjson) parse: a byte-level
+    # scan for "id"/"messages" cannot tell valid JSON from a malformed line.
+    for i, line in iter_jsonl_lines(jsonl_file):
+        if quick and b'"id"' in line and b'"messages"' in line:
+            continue
+        try:
+            obj = _json_loads(line)
+            if "id" not in obj:
+                problems.append(f"[WARN] {jsonl_file.name}:{i} - Missing 'id' field")
+            if "messages" not in obj:
+                problems.append(f"[WARN] {jsonl_file.name}:{i} - Missing 'messages' field")
+        except ValueError as e:
+            problems.append(f"[ERROR] {jsonl_file.name}:{i} - Invalid JSON: {e}")
+    return problems
+
+
+def validate_data_format(root: Path, quick: bool = False) -> int:
     """Validate existing JSONL files. Returns count of errors."""
     errors = 0
     processed_dir = root / "data/training/processed"
@@ -382,23 +597,14 @@ def validate_data_format(root: Path) -> int:
     if not processed_dir.exists():
         return 0
     
-    for jsonl_file in processed_dir.glob("*.jsonl"):
-        with jsonl_file.open("r", encoding="utf-8") as f:
-            for i, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    obj = json.loads(line)
-                    if "id" not in obj:
-                        print(f"[WARN] {jsonl_file.name}:{i} - Missing 'id' field")
-                        errors += 1
-                    if "messages" not in obj:
-                        print(f"[WARN] {jsonl_file.name}:{i} - Missing 'messages' field")
-                        errors += 1
-                except json.JSONDecodeError as e:
-                    print(f"[ERROR] {jsonl_file.name}:{i} - Invalid JSON: {e}")
-                    errors += 1
+    # Files are independent; workers only collect messages, printing stays in order here
+    jsonl_files = list(processed_dir.glob("*.jsonl"))
+    max_workers = min(8, os.cpu_count() or 1, len(jsonl_files)) or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for problems in pool.map(partial(_validate_file, quick=quick), jsonl_files):
+            for message in problems:
+                print(message)
+            errors += len(problems)
     
     if errors == 0:
         print("[OK] All JSONL files validated successfully")
@@ -409,6 +615,9 @@ def validate_data_format(root: Path) -> int:
 
 
 def main() -> None:
+    # CLI-only dependency; importers that just want the sample data skip it
+    import argparse
+
     parser = argparse.ArgumentParser(
         description="Prepare training data directories and sample files"
     )
@@ -427,6 +636,12 @@ def main() -> None:
         action="store_true",
         help="Validate existing JSONL files"
     )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="With --validate: accept lines containing both \"id\" and \"messages\" "
+             "without parsing them (faster, but may miss malformed JSON)"
+    )
     parser.add_argument(
         "--overwrite",
         action="store_true",
@@ -437,6 +652,18 @@ def main() -> None:
         action="store_true",
         help="Show what would be done without making changes"
     )
+    parser.add_argument(
+        "--output-format",
+        choices=OUTPUT_FORMATS,
+        default="jsonl",
+        help="Sample file format: jsonl, or arrow/parquet (zstd, needs pyarrow)"
+    )
+    parser.add_argument(
+        "--parallel-workers",
+        type=int,
+        default=3,
+        help="Number of sample files written concurrently"
+    )
     parser.add_argument(
         "--root",
         type=str,
@@ -457,12 +684,18 @@ def main() -> None:
         create_directories(root, dry_run=args.dry_run)
     
     if args.create_samples and not args.dry_run:
-        create_sample_data(root, overwrite=args.overwrite)
+        create_sample_data(
+            root,
+            overwrite=args.overwrite,
+            dirs_created=args.create_dirs,
+            workers=args.parallel_workers,
+            output_format=args.output_format,
+        )
     elif args.create_samples and args.dry_run:
         print("[DRY-RUN] Would create sample data files")
     
     if args.validate:
-        validate_data_format(root)
+        validate_data_format(root, quick=args.quick)
 
 
 if __name__ == "__main__":
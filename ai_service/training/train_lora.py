@@ -13,16 +13,21 @@ Enhancements:
 from __future__ import annotations
 
 import argparse
+import gc
+import importlib.util
 import json
 import os
-import subprocess
 import sys
+import traceback
+from bisect import bisect_left
 from datetime import datetime
+from functools import lru_cache, partial
+from itertools import chain
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import torch
-from datasets import Dataset
+from datasets import Dataset, Features, Value
 from transformers import (
     AutoModelForCausalLM,
     AutoTokenizer,
@@ -36,9 +41,32 @@ try:
 except ImportError as exc:  # pragma: no cover
     raise SystemExit("Missing dependency: peft. Install with: pip install peft") from exc
 
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type.
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+JSONL_BUFFER_SIZE = 1 << 20
+
 
 ALLOWED_ROLES = {"system", "user", "assistant"}
 
+# Rows per Dataset.map call; each batch is encoded by one tokenizer call
+TOKENIZE_BATCH_SIZE = 1000
+
+# Batches are padded to a multiple of this under torch.compile
+COMPILE_PAD_MULTIPLE = 64
+
+# Generous upper bound on characters per token; content beyond max_length times this
+# cannot survive token-level truncation, so it is cut before tokenizing
+MAX_CHARS_PER_TOKEN = 16
+
+# Schema of the normalized samples; fixed so Arrow never has to infer it
+SAMPLE_FEATURES = Features({"messages": [{"role": Value("string"), "content": Value("string")}]})
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="LoRA/QLoRA finetuning for chat models")
@@ -58,6 +86,10 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--learning_rate", type=float, default=1e-4)
     parser.add_argument("--weight_decay", type=float, default=0.0)
     parser.add_argument("--warmup_ratio", type=float, default=0.03)
+    parser.add_argument("--optim", type=str, default="",
+                        choices=["", "paged_adamw_8bit", "adamw_torch", "adamw_torch_fused"],
+                        help="Optimizer (default: paged_adamw_8bit with --use_qlora, "
+                             "else adamw_torch_fused on CUDA, else adamw_torch)")
 
     parser.add_argument("--logging_steps", type=int, default=10)
     parser.add_argument("--save_steps", type=int, default=200)
@@ -68,6 +100,21 @@ def parse_args() -> argparse.Namespace:
     parser.add_argument("--bf16", action="store_true")
     parser.add_argument("--fp16", action="store_true")
 
+    parser.add_argument("--attn_implementation", type=str,
+                        choices=["auto", "flash_attention_2", "sdpa", "eager"], default="auto",
+                        help="Attention kernel; auto uses FlashAttention-2 on Ampere+ GPUs when "
+                             "flash-attn is installed and training in fp16/bf16, else SDPA")
+
+    parser.add_argument("--torch_compile_mode", type=str,
+                        choices=["none", "default", "reduce-overhead", "max-autotune"], default="none",
+                        help="Compile the model with torch.compile (not supported with --use_qlora)")
+
+    parser.add_argument("--use_liger_kernel", action="store_true",
+                        help="Patch the base model with Liger fused RMSNorm/RoPE/SwiGLU/cross-entropy kernels")
+
+    parser.add_argument("--reentrant_checkpointing", action="store_true",
+                        help="Use reentrant gradient checkpointing (default: non-reentrant)")
+
     parser.add_argument("--lora_r", type=int, default=16)
     parser.add_argument("--lora_alpha", type=int, default=32)
     parser.add_argument("--lora_dropout", type=float, default=0.05)
@@ -78,7 +125,21 @@ def parse_args() -> argparse.Namespace:
         help="Comma-separated module names for LoRA",
     )
 
-    parser.add_argument("--num_proc", type=int, default=1)
+    parser.add_argument("--num_proc", type=int, default=1,
+                        help="Dataset.map worker processes (1 keeps the fast tokenizer's own threading)")
+    parser.add_argument("--group_by_length", action="store_true", default=True,
+                        help="Batch samples of similar length together to cut padding")
+    parser.add_argument("--no_group_by_length", action="store_false", dest="group_by_length")
+    parser.add_argument("--pack_sequences", action="store_true",
+                        help="Concatenate short samples into rows of up to max_length tokens "
+                             "(requires FlashAttention-2)")
+    parser.add_argument("--dataloader_num_workers", type=int, default=2,
+                        help="DataLoader worker processes for collation")
+    parser.add_argument("--dataloader_prefetch_factor", type=int, default=4,
+                        help="Batches prefetched per DataLoader worker")
+    parser.add_argument("--dataset_cache_dir", type=str, default="",
+                        help="Cache directory for the Arrow sample/tokenized datasets "
+                             "(default: the datasets library cache)")
     parser.add_argument("--resume_from_checkpoint", type=str, default="")
     parser.add_argument("--report_to", type=str, default="none",
                         help="Reporting backend: none, tensorboard, wandb")
@@ -112,6 +173,14 @@ def parse_args() -> argparse.Namespace:
     return parser.parse_args()
 
 
+@lru_cache(maxsize=None)
+def _list_jsonl(directory: str) -> Tuple[Path, ...]:
+    """Sorted *.jsonl files in a directory, listed once per process."""
+    with os.scandir(directory) as entries:
+        names = sorted(entry.name for entry in entries if entry.name.endswith(".jsonl") and entry.is_file())
+    return tuple(Path(directory, name) for name in names)
+
+
 def expand_paths(paths: str) -> List[Path]:
     results: List[Path] = []
     for raw in paths.split(","):
@@ -119,7 +188,7 @@ def expand_paths(paths: str) -> List[Path]:
         if not path.exists():
             raise FileNotFoundError(f"Path not found: {path}")
         if path.is_dir():
-            results.extend(sorted(path.glob("*.jsonl")))
+            results.extend(_list_jsonl(str(path)))
         else:
             results.append(path)
     if not results:
@@ -127,26 +196,6 @@ def expand_paths(paths: str) -> List[Path]:
     return results
 
 
-def load_jsonl(paths: List[Path]) -> List[Dict[str, Any]]:
-    items: List[Dict[str, Any]] = []
-    for path in paths:
-        with path.open("r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    obj = json.loads(line)
-                except json.JSONDecodeError:
-                    continue
-                if "messages" not in obj:
-                    continue
-                items.append(obj)
-    if not items:
-        raise ValueError("No valid samples loaded from JSONL files")
-    return items
-
-
 def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     normalized: List[Dict[str, str]] = []
     for msg in messages:
@@ -169,83 +218,286 @@ def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     return normalized
 
 
-def build_input_and_labels(tokenizer, messages: List[Dict[str, str]], max_length: int, truncate_from: str):
+def iter_samples(files: List[Tuple[str, int, int]]) -> Iterator[Dict[str, Any]]:
+    """Yield normalized samples from (path, size, mtime_ns) JSONL entries, skipping invalid lines."""
+    for path, _size, _mtime_ns in files:
+        with open(path, "rb", buffering=JSONL_BUFFER_SIZE) as f:
+            for line in f:
+                # Blank lines fail to decode too, so they need no separate strip() check
+                try:
+                    obj = _json_loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if "messages" not in obj:
+                    continue
+                yield {"messages": normalize_messages(obj["messages"])}
+
+
+def load_samples(paths: List[Path], cache_dir: Optional[str] = None) -> Dataset:
+    """Stream JSONL samples into a memory-mapped Arrow dataset.
+
+    File sizes and mtimes are part of the generator kwargs, so the datasets cache
+    (and every map() cached on top of it) is reused only while the files are unchanged.
+    """
+    files = []
+    for path in paths:
+        stat = path.stat()
+        files.append((str(path), stat.st_size, stat.st_mtime_ns))
+    try:
+        return Dataset.from_generator(
+            iter_samples,
+            features=SAMPLE_FEATURES,
+            gen_kwargs={"files": files},
+            cache_dir=cache_dir,
+        )
+    except ValueError as exc:  # datasets refuses to build an empty split
+        raise ValueError("No valid samples loaded from JSONL files") from exc
+
+
+def pretruncate_messages(
+    messages: List[Dict[str, str]], char_budget: int, truncate_from: str
+) -> List[Dict[str, str]]:
+    """Trim message contents past char_budget characters on the side truncation drops.
+
+    Messages are shortened or emptied but never removed, so the chat template
+    still sees the same roles in the same order.
+    """
+    if sum(len(m["content"]) for m in messages) <= char_budget:
+        return messages
+    trimmed = list(messages)
+    order = range(len(trimmed)) if truncate_from == "right" else reversed(range(len(trimmed)))
+    remaining = char_budget
+    for idx in order:
+        content = trimmed[idx]["content"]
+        if len(content) > remaining:
+            kept = content[:remaining] if truncate_from == "right" else content[len(content) - remaining:]
+            trimmed[idx] = {"role": trimmed[idx]["role"], "content": kept}
+        remaining = max(remaining - len(content), 0)
+    return trimmed
+
+
+def render_chat(tokenizer, messages: List[Dict[str, str]]) -> Tuple[str, List[Tuple[int, int]]]:
+    """Render the chat template, returning the text and the character span of each assistant message.
+
+    Only the prefixes that end right before or at an assistant message are rendered.
+    """
+    render = partial(tokenizer.apply_chat_template, tokenize=False, add_generation_prompt=False)
+    text = ""
+    assistant_spans: List[Tuple[int, int]] = []
+    start = 0
+    last = len(messages) - 1
+    for idx, msg in enumerate(messages):
+        is_assistant = msg["role"] == "assistant"
+        if idx < last and not is_assistant and messages[idx + 1]["role"] != "assistant":
+            continue
+        text = render(messages[: idx + 1])
+        if is_assistant:
+            assistant_spans.append((start, len(text)))
+        start = len(text)
+    return text, assistant_spans
+
+
+def _prefix_token_count(tokenizer, text: str, char_offset: int, total: int) -> int:
+    """Number of tokens in text[:char_offset], for slow tokenizers without offset mappings."""
+    if char_offset >= len(text):
+        return total
+    return len(tokenizer(text[:char_offset], add_special_tokens=False)["input_ids"])
+
+
+def build_input_and_labels(
+    tokenizer,
+    conversations: List[List[Dict[str, str]]],
+    max_length: int,
+    truncate_from: str,
+) -> Dict[str, List[List[int]]]:
+    """Tokenize a batch of conversations, masking everything but assistant turns in the labels.
+
+    All texts in the batch go through a single tokenizer call so a fast tokenizer
+    can encode them in parallel.
+    """
+    if max_length:
+        char_budget = max_length * MAX_CHARS_PER_TOKEN
+        conversations = [pretruncate_messages(messages, char_budget, truncate_from) for messages in conversations]
+
     use_chat_template = hasattr(tokenizer, "apply_chat_template") and getattr(tokenizer, "chat_template", None)
     if use_chat_template:
-        input_ids = tokenizer.apply_chat_template(
-            messages,
-            tokenize=True,
-            add_generation_prompt=False,
+        # Tokenize each conversation once and locate assistant turns by where
+        # their rendered prefixes end, instead of re-tokenizing every prefix.
+        rendered = [render_chat(tokenizer, messages) for messages in conversations]
+        is_fast = getattr(tokenizer, "is_fast", False)
+        encoded = tokenizer(
+            [text for text, _ in rendered],
+            add_special_tokens=False,
+            return_offsets_mapping=is_fast,
         )
-        labels = [-100] * len(input_ids)
-
-        for idx, msg in enumerate(messages):
-            if msg["role"] != "assistant":
-                continue
-            prefix_ids = tokenizer.apply_chat_template(
-                messages[:idx],
-                tokenize=True,
-                add_generation_prompt=False,
-            )
-            full_ids = tokenizer.apply_chat_template(
-                messages[: idx + 1],
-                tokenize=True,
-                add_generation_prompt=False,
-            )
-            start = len(prefix_ids)
-            end = len(full_ids)
-            labels[start:end] = full_ids[start:end]
+        batch_input_ids = encoded["input_ids"]
+        batch_labels = []
+        for row, (text, assistant_spans) in enumerate(rendered):
+            input_ids = batch_input_ids[row]
+            if is_fast:
+                token_starts = [start for start, _ in encoded["offset_mapping"][row]]
+                token_spans = [
+                    (bisect_left(token_starts, char_start), bisect_left(token_starts, char_end))
+                    for char_start, char_end in assistant_spans
+                ]
+            else:
+                token_spans = [
+                    (
+                        _prefix_token_count(tokenizer, text, char_start, len(input_ids)),
+                        _prefix_token_count(tokenizer, text, char_end, len(input_ids)),
+                    )
+                    for char_start, char_end in assistant_spans
+                ]
+
+            labels = [-100] * len(input_ids)
+            for start, end in token_spans:
+                labels[start:end] = input_ids[start:end]
+            batch_labels.append(labels)
     else:
-        text = "\n".join([f"<{m['role']}>\n{m['content']}" for m in messages])
-        input_ids = tokenizer(text, add_special_tokens=True)["input_ids"]
-        labels = input_ids.copy()
+        texts = ["\n".join([f"<{m['role']}>\n{m['content']}" for m in messages]) for messages in conversations]
+        batch_input_ids = tokenizer(texts, add_special_tokens=True)["input_ids"]
+        batch_labels = [input_ids.copy() for input_ids in batch_input_ids]
 
-    if max_length and len(input_ids) > max_length:
+    if max_length:
         if truncate_from == "left":
-            input_ids = input_ids[-max_length:]
-            labels = labels[-max_length:]
+            window = slice(-max_length, None)
         else:
-            input_ids = input_ids[:max_length]
-            labels = labels[:max_length]
+            window = slice(None, max_length)
+        batch_input_ids = [input_ids[window] for input_ids in batch_input_ids]
+        batch_labels = [labels[window] for labels in batch_labels]
+
+    return {
+        "input_ids": batch_input_ids,
+        "labels": batch_labels,
+        "length": [len(input_ids) for input_ids in batch_input_ids],
+    }
+
+
+def tokenize_batch(batch: Dict[str, List[Any]], tokenizer, max_length: int, truncate_from: str):
+    return build_input_and_labels(tokenizer, batch["messages"], max_length, truncate_from)
+
+
+def pack_batch(batch: Dict[str, List[Any]], max_length: int) -> Dict[str, List[Any]]:
+    """Greedily concatenate consecutive tokenized samples into rows of at most max_length tokens.
+
+    position_ids restart at every sample boundary so FlashAttention-2 keeps attention
+    within each sample, and each sample's first label is masked so no token learns
+    to predict across a boundary.
+    """
+    rows: List[Dict[str, List[int]]] = []
+    current: Dict[str, List[int]] = {}
+    for input_ids, labels in zip(batch["input_ids"], batch["labels"]):
+        if not input_ids:
+            continue
+        if not current or len(current["input_ids"]) + len(input_ids) > max_length:
+            current = {"input_ids": [], "labels": [], "position_ids": []}
+            rows.append(current)
+        current["input_ids"].extend(input_ids)
+        current["labels"].append(-100)
+        current["labels"].extend(labels[1:])
+        current["position_ids"].extend(range(len(input_ids)))
+    return {
+        "input_ids": [row["input_ids"] for row in rows],
+        "labels": [row["labels"] for row in rows],
+        "position_ids": [row["position_ids"] for row in rows],
+        "length": [len(row["input_ids"]) for row in rows],
+    }
+
+
+def pack_samples(dataset: Dataset, max_length: int, num_proc: Optional[int] = None) -> Dataset:
+    """Pack a tokenized dataset batch by batch, so only one batch is ever held in memory.
+
+    Rows never span a batch boundary; that leaves at most one partly filled row
+    per TOKENIZE_BATCH_SIZE samples.
+    """
+    return dataset.map(
+        pack_batch,
+        batched=True,
+        batch_size=TOKENIZE_BATCH_SIZE,
+        fn_kwargs={"max_length": max_length},
+        remove_columns=dataset.column_names,
+        num_proc=num_proc,
+    )
+
 
-    attention_mask = [1] * len(input_ids)
+def collate_packed(features: List[Dict[str, Any]]):
+    """Flatten packed rows into one unpadded sequence; position_ids mark the sample boundaries."""
     return {
-        "input_ids": input_ids,
-        "attention_mask": attention_mask,
-        "labels": labels,
+        key: torch.tensor([list(chain.from_iterable(item[key] for item in features))], dtype=torch.long)
+        for key in ("input_ids", "labels", "position_ids")
     }
 
 
-def collate_batch(features: List[Dict[str, Any]], pad_token_id: int):
+def collate_batch(features: List[Dict[str, Any]], pad_token_id: int, pad_to_multiple_of: int = 0):
     max_len = max(len(x["input_ids"]) for x in features)
-    batch = {"input_ids": [], "attention_mask": [], "labels": []}
-    for item in features:
-        pad_len = max_len - len(item["input_ids"])
-        batch["input_ids"].append(item["input_ids"] + [pad_token_id] * pad_len)
-        batch["attention_mask"].append(item["attention_mask"] + [0] * pad_len)
-        batch["labels"].append(item["labels"] + [-100] * pad_len)
-    return {k: torch.tensor(v) for k, v in batch.items()}
+    if pad_to_multiple_of:
+        # Fewer distinct shapes, so a compiled model recompiles less often
+        max_len = -(-max_len // pad_to_multiple_of) * pad_to_multiple_of
+    shape = (len(features), max_len)
+    # Preallocate padded tensors and copy each row in, rather than padding Python lists.
+    # Plain long tensors, so the DataLoader can pin them for non-blocking copies to the GPU.
+    input_ids = torch.full(shape, pad_token_id, dtype=torch.long)
+    labels = torch.full(shape, -100, dtype=torch.long)
+    # Built from row lengths, not input_ids != pad_token_id: pad may fall back to eos,
+    # which also appears inside conversations
+    attention_mask = torch.zeros(shape, dtype=torch.long)
+    for row, item in enumerate(features):
+        length = len(item["input_ids"])
+        input_ids[row, :length] = torch.as_tensor(item["input_ids"], dtype=torch.long)
+        labels[row, :length] = torch.as_tensor(item["labels"], dtype=torch.long)
+        attention_mask[row, :length] = 1
+    return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+
+def resolve_attn_implementation(choice: str, half_precision: bool) -> str:
+    """Pick the attention kernel; "auto" prefers FlashAttention-2 when it can run."""
+    has_flash_attn = importlib.util.find_spec("flash_attn") is not None
+    if choice == "auto":
+        ampere = torch.cuda.is_available() and torch.cuda.get_device_capability()[0] >= 8
+        return "flash_attention_2" if has_flash_attn and ampere and half_precision else "sdpa"
+    if choice == "flash_attention_2":
+        if not has_flash_attn:
+            raise SystemExit(
+                "Missing dependency: flash-attn. "
+                "Install with: pip install flash-attn --no-build-isolation"
+            )
+        if not half_precision:
+            raise SystemExit("flash_attention_2 needs fp16/bf16 training: pass --bf16 or --fp16")
+    return choice
 
 
 def main() -> None:
     args = parse_args()
 
+    if torch.cuda.is_available():
+        # Let fp32 matmuls that escape autocast (e.g. an fp32 lm_head) use TF32 tensor cores
+        torch.set_float32_matmul_precision("high")
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.backends.cudnn.allow_tf32 = True
+
+    cache_dir = args.dataset_cache_dir or None
     train_paths = expand_paths(args.train_files)
-    train_items = load_jsonl(train_paths)
+    train_samples = load_samples(train_paths, cache_dir)
 
-    eval_items = []
+    eval_samples = None
     if args.eval_file:
-        eval_items = load_jsonl([Path(args.eval_file)])
+        eval_samples = load_samples([Path(args.eval_file)], cache_dir)
+
+    if args.pack_sequences and not args.max_length:
+        raise ValueError("--pack_sequences requires --max_length > 0")
 
     if args.early_stopping_patience > 0:
         if not args.eval_file:
             raise ValueError("--early_stopping_patience > 0 requires --eval_file to be set")
         if not args.load_best_model_at_end:
             raise ValueError("--early_stopping_patience > 0 requires --load_best_model_at_end=True")
-        if not eval_items:
+        if not eval_samples:
             raise ValueError("--early_stopping_patience > 0 requires eval_file with valid samples")
 
-    tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, trust_remote_code=True)
+    if args.use_liger_kernel and importlib.util.find_spec("liger_kernel") is None:
+        raise SystemExit("Missing dependency: liger-kernel. Install with: pip install liger-kernel")
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_name_or_path, use_fast=True, trust_remote_code=True)
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
 
@@ -267,10 +519,19 @@ def main() -> None:
             "torch_dtype": compute_dtype,
         })
 
+    model_kwargs["attn_implementation"] = resolve_attn_implementation(
+        args.attn_implementation, half_precision=args.bf16 or args.fp16
+    )
+    if args.pack_sequences and model_kwargs["attn_implementation"] != "flash_attention_2":
+        # Only the FlashAttention-2 varlen path splits attention on position_ids resets
+        raise SystemExit("--pack_sequences needs FlashAttention-2: install flash-attn and pass --bf16 or --fp16")
     model = AutoModelForCausalLM.from_pretrained(args.model_name_or_path, **model_kwargs)
 
+    gradient_checkpointing_kwargs = {"use_reentrant": args.reentrant_checkpointing}
     if args.use_qlora:
-        model = prepare_model_for_kbit_training(model)
+        model = prepare_model_for_kbit_training(
+            model, gradient_checkpointing_kwargs=gradient_checkpointing_kwargs
+        )
 
     lora_config = LoraConfig(
         r=args.lora_r,
@@ -285,28 +546,45 @@ def main() -> None:
     if hasattr(model, "enable_input_require_grads"):
         model.enable_input_require_grads()
 
-    def tokenize_sample(sample: Dict[str, Any]):
-        messages = normalize_messages(sample["messages"])
-        return build_input_and_labels(
-            tokenizer,
-            messages,
-            max_length=args.max_length,
-            truncate_from=args.truncate_from,
+    def tokenize_samples(samples: Dataset) -> Dataset:
+        # Disk-backed input, so datasets caches the result (keyed on the tokenizer and
+        # fn_kwargs) and reruns load it memory-mapped
+        return samples.map(
+            tokenize_batch,
+            batched=True,
+            batch_size=TOKENIZE_BATCH_SIZE,
+            fn_kwargs={
+                "tokenizer": tokenizer,
+                "max_length": args.max_length,
+                "truncate_from": args.truncate_from,
+            },
+            remove_columns=samples.column_names,
+            num_proc=args.num_proc,
         )
 
-    train_dataset = Dataset.from_list(train_items).map(
-        tokenize_sample,
-        remove_columns=Dataset.from_list(train_items).column_names,
-        num_proc=args.num_proc,
-    )
+    train_dataset = tokenize_samples(train_samples)
 
     eval_dataset = None
-    if eval_items:
-        eval_dataset = Dataset.from_list(eval_items).map(
-            tokenize_sample,
-            remove_columns=Dataset.from_list(eval_items).column_names,
-            num_proc=args.num_proc,
-        )
+    if eval_samples is not None:
+        eval_dataset = tokenize_samples(eval_samples)
+
+    if args.pack_sequences:
+        train_dataset = pack_samples(train_dataset, args.max_length, args.num_proc)
+        if eval_dataset is not None:
+            eval_dataset = pack_samples(eval_dataset, args.max_length, args.num_proc)
+        print(f"[INFO] Packed training samples into {len(train_dataset)} rows")
+
+    optim = args.optim
+    if not optim:
+        if args.use_qlora:
+            optim = "paged_adamw_8bit"
+        else:
+            optim = "adamw_torch_fused" if torch.cuda.is_available() else "adamw_torch"
+
+    torch_compile = args.torch_compile_mode != "none"
+    if torch_compile and args.use_qlora:
+        print("[WARN] --torch_compile_mode is ignored with --use_qlora (bitsandbytes layers do not compile)")
+        torch_compile = False
 
     training_args = TrainingArguments(
         output_dir=args.output_dir,
@@ -317,6 +595,7 @@ def main() -> None:
         learning_rate=args.learning_rate,
         weight_decay=args.weight_decay,
         warmup_ratio=args.warmup_ratio,
+        optim=optim,
         logging_steps=args.logging_steps,
         save_steps=args.save_steps,
         eval_steps=args.eval_steps,
@@ -327,6 +606,19 @@ def main() -> None:
         bf16=args.bf16,
         fp16=args.fp16,
         gradient_checkpointing=True,
+        gradient_checkpointing_kwargs=gradient_checkpointing_kwargs,
+        # Trainer picks the Liger patch for the model family and applies it to the PEFT base model
+        use_liger_kernel=args.use_liger_kernel,
+        torch_compile=torch_compile,
+        torch_compile_mode=args.torch_compile_mode if torch_compile else None,
+        dataloader_pin_memory=True,
+        # Keep the precomputed "length" column for the length-grouped sampler;
+        # collate_batch only forwards the model inputs
+        remove_unused_columns=False,
+        group_by_length=args.group_by_length,
+        length_column_name="length",
+        dataloader_num_workers=args.dataloader_num_workers,
+        dataloader_prefetch_factor=args.dataloader_prefetch_factor if args.dataloader_num_workers > 0 else None,
         # New: Logging directory
         logging_dir=args.logging_dir,
         # New: Best model loading for early stopping
@@ -346,7 +638,11 @@ def main() -> None:
         args=training_args,
         train_dataset=train_dataset,
         eval_dataset=eval_dataset,
-        data_collator=lambda items: collate_batch(items, tokenizer.pad_token_id),
+        data_collator=collate_packed if args.pack_sequences else partial(
+            collate_batch,
+            pad_token_id=tokenizer.pad_token_id,
+            pad_to_multiple_of=COMPILE_PAD_MULTIPLE if torch_compile else 0,
+        ),
         callbacks=callbacks if callbacks else None,
     )
 
@@ -366,11 +662,16 @@ def main() -> None:
             "train_files": args.train_files,
             "eval_file": args.eval_file,
             "max_length": args.max_length,
+            "group_by_length": args.group_by_length,
+            "pack_sequences": args.pack_sequences,
             "lora_r": args.lora_r,
             "lora_alpha": args.lora_alpha,
             "lora_dropout": args.lora_dropout,
             "target_modules": args.target_modules,
             "use_qlora": args.use_qlora,
+            "attn_implementation": model_kwargs["attn_implementation"],
+            "use_liger_kernel": args.use_liger_kernel,
+            "torch_compile_mode": args.torch_compile_mode if torch_compile else "none",
             "bf16": args.bf16,
             "fp16": args.fp16,
             "per_device_train_batch_size": args.per_device_train_batch_size,
@@ -378,6 +679,7 @@ def main() -> None:
             "num_train_epochs": args.num_train_epochs,
             "learning_rate": args.learning_rate,
             "warmup_ratio": args.warmup_ratio,
+            "optim": optim,
             "early_stopping_patience": args.early_stopping_patience,
             "load_best_model_at_end": args.load_best_model_at_end,
         }
@@ -392,12 +694,31 @@ def main() -> None:
         benchmark_file = args.benchmark_file or args.eval_file
         if not benchmark_file:
             print("[WARN] --auto_eval requires --benchmark_file or --eval_file")
-        else:
+        elif trainer.is_world_process_zero():
+            # Under DDP only rank 0 evaluates. Auto-eval reloads the saved adapter in
+            # this process; free the training copy first
+            del trainer, model
+            gc.collect()
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
             run_auto_eval(args.model_name_or_path, args.output_dir, benchmark_file)
 
 
+def load_script(path: Path):
+    """Import a sibling training script as a module so its main() can run in this process."""
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so pickle can resolve its functions by name (eval_metrics' process pool)
+    sys.modules[path.stem] = module
+    spec.loader.exec_module(module)
+    return module
+
+
 def run_auto_eval(model_name: str, adapter_path: str, benchmark_file: str) -> None:
-    """Run generate_predictions.py and eval_metrics.py for auto evaluation."""
+    """Run generate_predictions.py and eval_metrics.py for auto evaluation.
+
+    Both scripts run in-process, reusing the torch/transformers imports already loaded.
+    """
     script_dir = Path(__file__).resolve().parent
     predictions_file = os.path.join(adapter_path, "predictions.jsonl")
     eval_report = os.path.join(adapter_path, "eval_report.json")
@@ -408,18 +729,18 @@ def run_auto_eval(model_name: str, adapter_path: str, benchmark_file: str) -> No
         print(f"[WARN] generate_predictions.py not found at {gen_script}")
         return
 
-    gen_cmd = [
-        sys.executable, str(gen_script),
+    gen_argv = [
         "--model_name_or_path", model_name,
         "--adapter_path", adapter_path,
         "--eval_file", benchmark_file,
         "--output", predictions_file,
     ]
-    result = subprocess.run(gen_cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"[ERROR] generate_predictions.py failed:\n{result.stderr}")
+    try:
+        load_script(gen_script).main(gen_argv)
+    except (Exception, SystemExit) as exc:
+        print(f"[ERROR] generate_predictions.py failed: {exc!r}")
+        traceback.print_exc()
         return
-    print(result.stdout)
 
     print("[AUTO-EVAL] Step 2: Running evaluation...")
     eval_script = script_dir / "eval_metrics.py"
@@ -427,18 +748,18 @@ def run_auto_eval(model_name: str, adapter_path: str, benchmark_file: str) -> No
         print(f"[WARN] eval_metrics.py not found at {eval_script}")
         return
 
-    eval_cmd = [
-        sys.executable, str(eval_script),
+    eval_argv = [
         "--eval_file", benchmark_file,
         "--pred_file", predictions_file,
         "--output", eval_report,
         "--dump_details",
     ]
-    result = subprocess.run(eval_cmd, capture_output=True, text=True)
-    if result.returncode != 0:
-        print(f"[ERROR] eval_metrics.py failed:\n{result.stderr}")
+    try:
+        load_script(eval_script).main(eval_argv)
+    except (Exception, SystemExit) as exc:
+        print(f"[ERROR] eval_metrics.py failed: {exc!r}")
+        traceback.print_exc()
         return
-    print(result.stdout)
     print(f"[AUTO-EVAL] Complete. Report saved to: {eval_report}")
 
 